@@ -0,0 +1,94 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from . import sqaws
+from .model import Instance
+
+"""
+Stopping and terminating instances. The requests are sent with bounded concurrency, and then every instance is polled
+until it reaches its final state, with one batched describe_instances call per region per poll rather than one waiter
+per instance.
+"""
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_DEADLINE_SECONDS = 600
+POLL_INTERVAL_SECONDS = 5
+
+STOP = 'stop'
+TERMINATE = 'terminate'
+TARGET_STATES = {STOP: 'stopped', TERMINATE: 'terminated'}
+
+
+# The outcome of stopping or terminating one instance
+@dataclass
+class ActionResult:
+    instance: Instance
+    action: str                 # STOP or TERMINATE
+    requested: bool = False     # Whether the stop/terminate request succeeded
+    requested_at: float = None  # time.monotonic() when the request returned
+    final_state: str = None     # The last state we saw, or None if we never saw one
+    latency: float = None       # Seconds from the request until the target state was seen, or None if it never was
+
+    @property
+    def succeeded(self) -> bool:
+        return self.latency is not None
+
+    def describe(self) -> str:
+        if not self.requested:
+            return 'request failed'
+        if self.succeeded:
+            return '{} after {:.0f}s'.format(self.final_state, self.latency)
+        return 'still {} at the deadline'.format(self.final_state or 'unknown')
+
+
+def request_action(result: ActionResult) -> None:
+    instance = result.instance
+    if result.action == STOP:
+        result.requested = sqaws.stop_instance(instance.region_name, instance.instance_id)
+    else:
+        result.requested = sqaws.terminate_instance(instance.region_name, instance.instance_id)
+    result.requested_at = time.monotonic()
+
+
+# Poll the state of the given instances, which must all be in one region
+def poll_region(results: list) -> None:
+    region_name = results[0].instance.region_name
+    states = sqaws.describe_instance_states(region_name, [r.instance.instance_id for r in results])
+    now = time.monotonic()
+    for result in results:
+        result.final_state = states.get(result.instance.instance_id, result.final_state)
+        if result.final_state == TARGET_STATES[result.action]:
+            result.latency = now - result.requested_at
+
+
+def run_actions(actions: list, concurrency: int = DEFAULT_CONCURRENCY,
+                deadline_seconds: float = DEFAULT_DEADLINE_SECONDS,
+                poll_interval_seconds: float = POLL_INTERVAL_SECONDS) -> list:
+    """ Stop or terminate instances, and wait for them to get there
+    :param actions: A list of (Instance, STOP or TERMINATE) tuples
+    :param concurrency: How many API calls to have in flight at once
+    :param deadline_seconds: Give up waiting for state transitions after this long
+    :return: A list of ActionResults, in the same order as the actions
+    """
+    deadline = time.monotonic() + deadline_seconds
+    results = [ActionResult(instance=instance, action=action) for instance, action in actions]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(request_action, results))
+
+        pending = [r for r in results if r.requested]
+        while len(pending) > 0:
+            by_region = dict()
+            for result in pending:
+                by_region.setdefault(result.instance.region_name, []).append(result)
+            list(executor.map(poll_region, by_region.values()))
+
+            pending = [r for r in pending if not r.succeeded]
+            if len(pending) == 0 or time.monotonic() + poll_interval_seconds > deadline:
+                break
+            time.sleep(poll_interval_seconds)
+
+    for result in results:
+        print('{} {}: {}'.format(result.action.capitalize(), result.instance.instance_id, result.describe()))
+    return results
@@ -0,0 +1,75 @@
+import heapq
+import itertools
+from dataclasses import dataclass, field
+
+from .model import money_to_string
+
+"""
+Cost aggregation over the EC2 inventory. Everything is computed in a single pass, and the "top N" lists are kept in
+bounded heaps, so memory stays small no matter how many instances there are.
+"""
+
+GROUP_BY_FIELDS = ['contact', 'region_name', 'instance_type', 'nagbot_state']
+
+
+# Number of instances and their total monthly price for one value of a group-by field
+@dataclass
+class CostGroup:
+    count: int = 0
+    monthly_price: float = 0.0
+
+    def add(self, monthly_price: float) -> None:
+        self.count += 1
+        self.monthly_price += monthly_price
+
+
+@dataclass
+class CostReport:
+    total: CostGroup = field(default_factory=CostGroup)
+    by_state: dict = field(default_factory=dict)   # Instance state -> CostGroup
+    groups: dict = field(default_factory=dict)     # Group-by field name -> {value -> CostGroup}
+    top_instances: list = field(default_factory=list)  # Most expensive instances, most expensive first
+    top_contacts: list = field(default_factory=list)   # (contact, CostGroup) for the biggest spenders, biggest first
+
+    def state(self, state: str) -> CostGroup:
+        return self.by_state.get(state, CostGroup())
+
+    def to_rows(self) -> list:
+        rows = [['Group', 'Value', 'Instances', 'Monthly Price']]
+        rows.append(['Total', '', self.total.count, money_to_string(self.total.monthly_price)])
+        for state, group in sorted(self.by_state.items()):
+            rows.append(['State', state, group.count, money_to_string(group.monthly_price)])
+        for field_name in GROUP_BY_FIELDS:
+            for value, group in sorted(self.groups[field_name].items(), key=lambda item: -item[1].monthly_price):
+                rows.append([field_name, value, group.count, money_to_string(group.monthly_price)])
+        return rows
+
+
+def aggregate_costs(instances, top_n: int = 5) -> CostReport:
+    report = CostReport()
+    report.groups = {field_name: dict() for field_name in GROUP_BY_FIELDS}
+    by_contact = report.groups['contact']
+    by_region = report.groups['region_name']
+    by_instance_type = report.groups['instance_type']
+    by_nagbot_state = report.groups['nagbot_state']
+    top_instances = []
+    counter = itertools.count()  # Tie-breaker, so that the heap never has to compare two instances
+
+    for i in instances:
+        price = i.monthly_price
+        report.total.add(price)
+        report.by_state.setdefault(i.state, CostGroup()).add(price)
+        by_contact.setdefault(i.contact, CostGroup()).add(price)
+        by_region.setdefault(i.region_name, CostGroup()).add(price)
+        by_instance_type.setdefault(i.instance_type, CostGroup()).add(price)
+        by_nagbot_state.setdefault(i.nagbot_state, CostGroup()).add(price)
+
+        if len(top_instances) < top_n:
+            heapq.heappush(top_instances, (price, next(counter), i))
+        elif top_n > 0 and price > top_instances[0][0]:
+            heapq.heapreplace(top_instances, (price, next(counter), i))
+
+    report.top_instances = [i for _, _, i in sorted(top_instances, key=lambda entry: entry[:2], reverse=True)]
+    report.top_contacts = heapq.nlargest(top_n, report.groups['contact'].items(),
+                                         key=lambda item: item[1].monthly_price)
+    return report
@@ -6,7 +6,7 @@ import pygsheets
 TODAY_YYYY_MM_DD = datetime.today().strftime('%Y-%m-%d')
 
 
-def write_to_spreadsheet(data):
+def write_to_spreadsheet(data, summary=None):
     spreadsheet = get_sheet()
     worksheet = spreadsheet.add_worksheet(TODAY_YYYY_MM_DD, index=0)
     worksheet.update_values(crange='A1', values=[['Last updated: ' + datetime.utcnow().isoformat() + 'Z']])
@@ -24,9 +24,19 @@ def write_to_spreadsheet(data):
     worksheet.sort_range('A3', 'Z999', basecolumnindex=1)
     worksheet.sort_range('A3', 'Z999', basecolumnindex=7, sortorder='DESCENDING')
 
+    if summary is not None:
+        write_summary_worksheet(spreadsheet, summary)
+
     return spreadsheet.url;
 
 
+# Write aggregated costs (by state, contact, region, etc.) to a separate worksheet next to the day's data
+def write_summary_worksheet(spreadsheet, summary):
+    worksheet = spreadsheet.add_worksheet(TODAY_YYYY_MM_DD + ' Summary', index=1)
+    worksheet.update_values(crange='A1', values=summary)
+    worksheet.frozen_rows = 1
+
+
 def get_sheet():
     return get_client().open_by_key('1ecCAnxoc-zej-84ROFMerw88mglWrUrXvbbPJaDlKrg')
 
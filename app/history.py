@@ -0,0 +1,118 @@
+import argparse
+import os
+import sqlite3
+import statistics
+from dataclasses import astuple, fields
+from datetime import datetime, timedelta
+
+from .model import Instance
+
+"""
+A local SQLite store with one snapshot of the EC2 inventory per run date. This makes it cheap to answer questions about
+history (cost trends, how long it takes for instances to get stopped) without scraping one Google Sheet tab per day.
+"""
+
+DEFAULT_HISTORY_DB = 'nagbot-history.db'
+
+INSTANCE_COLUMNS = [f.name for f in fields(Instance)]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    run_date TEXT NOT NULL,
+    {columns},
+    PRIMARY KEY (run_date, instance_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS snapshots_by_contact ON snapshots (contact, run_date);
+CREATE INDEX IF NOT EXISTS snapshots_by_state ON snapshots (state, instance_id, run_date);
+""".format(columns=',\n    '.join('{} {}'.format(f.name, 'REAL' if f.type is float else 'TEXT') for f in fields(Instance)))
+
+
+# The history database lives in a local file, which can be overridden with the NAGBOT_HISTORY_DB environment variable
+def get_history_db_path() -> str:
+    return os.environ.get('NAGBOT_HISTORY_DB', DEFAULT_HISTORY_DB)
+
+
+def connect(path: str = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(path or get_history_db_path())
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# Save every instance for a run date in a single transaction. Re-running on the same date replaces that date's rows.
+def write_snapshot(conn: sqlite3.Connection, run_date: str, instances: list) -> None:
+    insert = 'INSERT INTO snapshots (run_date, {}) VALUES (?, {})' \
+        .format(', '.join(INSTANCE_COLUMNS), ', '.join('?' for _ in INSTANCE_COLUMNS))
+    with conn:
+        conn.execute('DELETE FROM snapshots WHERE run_date = ?', (run_date,))
+        conn.executemany(insert, ((run_date,) + astuple(i) for i in instances))
+
+
+def read_snapshot(conn: sqlite3.Connection, run_date: str) -> list:
+    query = 'SELECT {} FROM snapshots WHERE run_date = ? ORDER BY instance_id'.format(', '.join(INSTANCE_COLUMNS))
+    return [Instance(*row) for row in conn.execute(query, (run_date,))]
+
+
+# Total monthly cost per run date and contact, from start_date onwards
+def cost_trend(conn: sqlite3.Connection, start_date: str, contact: str = None) -> list:
+    query = 'SELECT run_date, contact, SUM(monthly_price), COUNT(*) FROM snapshots WHERE run_date >= ?'
+    params = [start_date]
+    if contact is not None:
+        query += ' AND contact = ?'
+        params.append(contact)
+    query += ' GROUP BY run_date, contact ORDER BY run_date, contact'
+    return conn.execute(query, params).fetchall()
+
+
+# For each instance which was seen running and later seen stopped, the number of days between the two.
+def time_to_stop_days(conn: sqlite3.Connection, start_date: str = '') -> list:
+    query = """
+        SELECT running_date,
+               (SELECT MIN(run_date) FROM snapshots AS stopped
+                WHERE stopped.state = 'stopped'
+                  AND stopped.instance_id = first_running.instance_id
+                  AND stopped.run_date > first_running.running_date) AS stopped_date
+        FROM (SELECT instance_id, MIN(run_date) AS running_date FROM snapshots
+              WHERE state = 'running' AND run_date >= ? GROUP BY instance_id) AS first_running
+    """
+    return [(parse_day(stopped) - parse_day(running)).days
+            for running, stopped in conn.execute(query, (start_date,)) if stopped is not None]
+
+
+def parse_day(date: str) -> datetime:
+    return datetime.strptime(date, '%Y-%m-%d')
+
+
+def print_cost_trend(conn, days, contact):
+    start_date = (datetime.today() - timedelta(days=days)).strftime('%Y-%m-%d')
+    for run_date, row_contact, total, count in cost_trend(conn, start_date, contact):
+        print('{}\t{}\t{}\t${:.2f}'.format(run_date, row_contact or '(no contact)', count, total))
+
+
+def print_time_to_stop(conn, days):
+    start_date = (datetime.today() - timedelta(days=days)).strftime('%Y-%m-%d')
+    durations = time_to_stop_days(conn, start_date)
+    if len(durations) == 0:
+        print('No instances were seen running and then stopped in the last {} days'.format(days))
+        return
+    print('Instances stopped: {}'.format(len(durations)))
+    print('Mean days to stop: {:.1f}'.format(statistics.mean(durations)))
+    print('Median days to stop: {}'.format(statistics.median(durations)))
+    print('Max days to stop: {}'.format(max(durations)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query the history of Nagbot inventory snapshots')
+    parser.add_argument('query', choices=['trend', 'time-to-stop'],
+                        help="'trend' prints monthly cost per day and contact, "
+                             "'time-to-stop' prints how long instances ran before being stopped")
+    parser.add_argument('--days', type=int, default=90, help='How many days of history to look at')
+    parser.add_argument('--contact', help="Only include instances with this 'Contact' tag (trend only)")
+    parser.add_argument('--db', help='Path to the history database (default: $NAGBOT_HISTORY_DB or %s)'
+                        % DEFAULT_HISTORY_DB)
+
+    args = parser.parse_args()
+    conn = connect(args.db)
+    if args.query == 'trend':
+        print_cost_trend(conn, args.days, args.contact)
+    else:
+        print_time_to_stop(conn, args.days)
@@ -0,0 +1,235 @@
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+
+from .model import Instance
+
+"""
+An incrementally updated EC2 inventory. Instead of scanning every region on every run, Nagbot can keep a snapshot of
+the inventory on disk and apply EC2 "state-change" and "tag change" events to it, as delivered by EventBridge to an
+SQS queue. A local JSON-lines file of events can stand in for the queue. A full scan is still done periodically, to
+reconcile anything the events missed.
+
+The AWS integration is only imported by the functions which use it, so that loading a saved snapshot stays fast.
+"""
+
+DEFAULT_FULL_SCAN_HOURS = 24
+
+# Limits on how much of the SQS queue one run reads. Anything left over is read by the next run. Received messages are
+# hidden from other readers for QUEUE_VISIBILITY_TIMEOUT_SECONDS, which has to cover reading, applying and deleting
+# them, or they would be delivered again before they're deleted.
+MAX_QUEUE_EVENTS_PER_RUN = 10000
+QUEUE_TIME_BUDGET_SECONDS = 60
+QUEUE_VISIBILITY_TIMEOUT_SECONDS = 300
+
+STATE_CHANGE_EVENT = 'EC2 Instance State-change Notification'
+TAG_CHANGE_EVENT = 'Tag Change on Resource'
+
+
+# Bookkeeping stored next to the snapshot
+@dataclass
+class InventoryState:
+    last_full_scan: str = ''  # ISO-8601 UTC time, like 2019-12-31T23:59:59
+    event_offset: int = 0     # How many bytes of the local event log have already been applied
+    # The time of the last event applied to each instance, keyed like "i-0123/state" or "i-0123/tags". SQS doesn't
+    # keep events in order, so older events which arrive late are dropped instead of undoing newer ones.
+    event_times: dict = field(default_factory=dict)
+
+
+# Save instances to a file, one JSON object per line
+def save_instances(path: str, instances) -> None:
+    write_atomically(path, ''.join(json.dumps(asdict(i)) + '\n' for i in instances))
+
+
+def load_instances(path: str) -> list:
+    with open(path) as f:
+        return [Instance(**json.loads(line)) for line in f if line.strip()]
+
+
+def get_state_path(snapshot_path: str) -> str:
+    return snapshot_path + '.state.json'
+
+
+def load_state(snapshot_path: str) -> InventoryState:
+    try:
+        with open(get_state_path(snapshot_path)) as f:
+            return InventoryState(**json.load(f))
+    except FileNotFoundError:
+        return InventoryState()
+
+
+def save_state(snapshot_path: str, state: InventoryState) -> None:
+    write_atomically(get_state_path(snapshot_path), json.dumps(asdict(state)))
+
+
+# Write to a temporary file and then rename it, so a crash never leaves a half-written file behind
+def write_atomically(path: str, contents: str) -> None:
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        f.write(contents)
+    os.replace(temp_path, path)
+
+
+# Read the events which were appended to a JSON-lines event log since the given byte offset
+def read_event_log(path: str, offset: int) -> tuple:
+    if not os.path.exists(path):
+        return [], offset
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    # Only consume complete lines, in case another process is in the middle of appending
+    end = data.rfind(b'\n') + 1
+    events = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+    return events, offset + end
+
+
+# Receive the events waiting in an SQS queue, returning the events and the receipt handles needed to delete them.
+# Stops once the queue is empty, or after max_events or time_budget_seconds, since events can keep arriving forever.
+def receive_queue_events(queue_url: str, max_events: int = MAX_QUEUE_EVENTS_PER_RUN,
+                         time_budget_seconds: float = QUEUE_TIME_BUDGET_SECONDS, clock=time.monotonic) -> tuple:
+    from . import sqaws
+
+    events = []
+    receipt_handles = []
+    deadline = clock() + time_budget_seconds
+    while len(events) < max_events and clock() < deadline:
+        messages = sqaws.receive_queue_messages(queue_url, QUEUE_VISIBILITY_TIMEOUT_SECONDS)
+        if len(messages) == 0:
+            break
+        for receipt_handle, body in messages:
+            receipt_handles.append(receipt_handle)
+            events.append(json.loads(body))
+    return events, receipt_handles
+
+
+def is_queue_url(events_source: str) -> bool:
+    return events_source.startswith('https://sqs.')
+
+
+# EventBridge event times look like 2019-12-31T23:59:59Z. Returns the same format as InventoryState.last_full_scan.
+def get_event_time(event: dict) -> str:
+    return event.get('time', '').rstrip('Z')
+
+
+# Whether an event is newer than anything already applied for this instance, and if so, record it as applied
+def is_newer_event(event_times: dict, key: str, event_time: str) -> bool:
+    if event_times is None or not event_time:
+        return True
+    if event_time < event_times.get(key, ''):
+        return False
+    event_times[key] = event_time
+    return True
+
+
+# Apply one EventBridge event to the inventory, which maps instance IDs to Instances. If event_times is given, events
+# older than the last one applied to the same instance are ignored.
+def apply_event(instances: dict, event: dict, event_times: dict = None) -> None:
+    detail_type = event.get('detail-type')
+    region_name = event.get('region')
+    detail = event.get('detail', {})
+    event_time = get_event_time(event)
+
+    if detail_type == STATE_CHANGE_EVENT:
+        instance_id = detail['instance-id']
+        if is_newer_event(event_times, instance_id + '/state', event_time):
+            apply_state_change(instances, region_name, instance_id, detail['state'])
+    elif detail_type == TAG_CHANGE_EVENT and detail.get('service') == 'ec2' \
+            and detail.get('resource-type') == 'instance':
+        for arn in event.get('resources', []):
+            # ARNs look like: arn:aws:ec2:us-east-1:123456789012:instance/i-0f06b49c1f16dcfde
+            instance_id = arn.split('/')[-1]
+            if is_newer_event(event_times, instance_id + '/tags', event_time):
+                apply_tag_change(instances, region_name, instance_id, detail.get('tags', {}))
+
+
+def apply_state_change(instances: dict, region_name: str, instance_id: str, state: str) -> None:
+    from . import sqaws
+
+    instance = instances.get(instance_id)
+    if instance is None:
+        if state != 'terminated':
+            add_instance(instances, region_name, instance_id)
+        return
+    instance.state = state
+    instance.reason = ''
+    instance.monthly_price = sqaws.compute_monthly_price(state, instance.monthly_server_price,
+                                                         instance.monthly_storage_price)
+
+
+def apply_tag_change(instances: dict, region_name: str, instance_id: str, tags: dict) -> None:
+    from . import sqaws
+
+    instance = instances.get(instance_id)
+    if instance is None:
+        add_instance(instances, region_name, instance_id)
+        return
+    for name, value in sqaws.get_tag_fields(tags).items():
+        setattr(instance, name, value)
+
+
+# An event for an instance we haven't seen yet, so look up everything else about it
+def add_instance(instances: dict, region_name: str, instance_id: str) -> None:
+    from . import sqaws
+
+    instance = sqaws.get_ec2_instance(region_name, instance_id)
+    if instance is not None:
+        instances[instance_id] = instance
+
+
+def is_full_scan_due(state: InventoryState, now: datetime, full_scan_hours: float) -> bool:
+    if not state.last_full_scan:
+        return True
+    last_full_scan = datetime.strptime(state.last_full_scan, '%Y-%m-%dT%H:%M:%S')
+    return now - last_full_scan >= timedelta(hours=full_scan_hours)
+
+
+def update_inventory(snapshot_path: str, events_source: str, full_scan_hours: float = DEFAULT_FULL_SCAN_HOURS,
+                     now: datetime = None) -> list:
+    """ Bring the inventory snapshot up to date and return its instances
+    :param snapshot_path: JSON-lines file holding the inventory between runs
+    :param events_source: An SQS queue URL, or the path of a local JSON-lines event log
+    :param full_scan_hours: How often to rescan every region, regardless of events
+    """
+    from . import sqaws
+
+    now = now or datetime.utcnow()
+    state = load_state(snapshot_path)
+    queue = events_source if is_queue_url(events_source) else None
+
+    if is_full_scan_due(state, now, full_scan_hours) or not os.path.exists(snapshot_path):
+        print('Doing a full scan to reconcile the inventory snapshot at ' + snapshot_path)
+        # Anything already in the event log or queue will be covered by the scan
+        if queue is not None:
+            _, receipt_handles = receive_queue_events(queue)
+            sqaws.delete_queue_messages(queue, receipt_handles)
+        elif os.path.exists(events_source):
+            state.event_offset = os.path.getsize(events_source)
+        instances = sqaws.list_ec2_instances()
+        state.last_full_scan = now.strftime('%Y-%m-%dT%H:%M:%S')
+        state.event_times = dict()
+        save_instances(snapshot_path, instances)
+        save_state(snapshot_path, state)
+        return instances
+
+    instances = {i.instance_id: i for i in load_instances(snapshot_path)}
+    if queue is None:
+        events, state.event_offset = read_event_log(events_source, state.event_offset)
+        receipt_handles = []
+    else:
+        events, receipt_handles = receive_queue_events(queue)
+
+    # Events from before the last full scan are already reflected in it
+    events = sorted((e for e in events if get_event_time(e) >= state.last_full_scan or not get_event_time(e)),
+                    key=get_event_time)
+    for event in events:
+        apply_event(instances, event, state.event_times)
+    print('Applied %d events to the inventory snapshot at %s' % (len(events), snapshot_path))
+
+    save_instances(snapshot_path, instances.values())
+    save_state(snapshot_path, state)
+    # Only delete messages from the queue once the snapshot which includes them is safely saved
+    if queue is not None and len(receipt_handles) > 0:
+        sqaws.delete_queue_messages(queue, receipt_handles)
+    return list(instances.values())
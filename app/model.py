@@ -0,0 +1,67 @@
+from dataclasses import dataclass
+
+"""
+The model classes shared by every part of Nagbot. This module deliberately doesn't import boto3 or any of the other
+integrations, so that modes which only work on saved data (like 'simulate') start quickly.
+"""
+
+
+# Convert floating point dollars to a readable string
+def money_to_string(str):
+    return '${:.2f}'.format(str)
+
+
+# Quote a string
+def quote(str):
+    return '"' + str + '"'
+
+
+# Model class for an EC2 instance
+@dataclass
+class Instance:
+    region_name: str
+    instance_id: str
+    state: str
+    reason: str
+    instance_type: str
+    name: str
+    operating_system: str
+    stop_after: str
+    terminate_after: str
+    contact: str
+    nagbot_state: str
+    monthly_price: float
+    monthly_server_price: float
+    monthly_storage_price: float
+
+    def to_header(self) -> str:
+        return ['Instance ID',
+                'Name',
+                'State',
+                'Stop After',
+                'Terminate After',
+                'Contact',
+                'Nagbot State',
+                'Monthly Price',
+                'Monthly Server Price',
+                'Monthly Storage Price',
+                'Region Name',
+                'Instance Type',
+                'Reason',
+                'OS']
+
+    def to_list(self) -> str:
+        return [self.instance_id,
+                self.name,
+                self.state,
+                self.stop_after,
+                self.terminate_after,
+                self.contact,
+                self.nagbot_state,
+                money_to_string(self.monthly_price),
+                money_to_string(self.monthly_server_price),
+                money_to_string(self.monthly_storage_price),
+                self.region_name,
+                self.instance_type,
+                self.reason,
+                self.operating_system]
@@ -3,22 +3,23 @@ __version__ = "1.6.0"
 __license__ = "MIT"
 
 import argparse
+import functools
 import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
-from . import gdocs
+from . import costs
 from . import parsing
-from . import sqaws
-from . import sqslack
+from .model import money_to_string
 
 TERMINATION_WARNING_DAYS = 3
+TOP_N = 5  # How many of the most expensive instances and contacts to list in the summary
 
 TODAY = datetime.today()
 TODAY_YYYY_MM_DD = TODAY.strftime('%Y-%m-%d')
-TODAY_IS_WEEKEND = TODAY.weekday() >= 4  # Days are 0-6. 4=Friday, 5=Saturday, 6=Sunday, 0=Monday
+NOW_YYYY_MM_DD_HH_MM = TODAY.strftime('%Y-%m-%d %H:%M')
 YESTERDAY_YYYY_MM_DD = (TODAY - timedelta(days=1)).strftime('%Y-%m-%d')
-MIN_TERMINATION_WARNING_YYYY_MM_DD = (TODAY - timedelta(days=3)).strftime('%Y-%m-%d')
 
 """
 PREREQUISITES:
@@ -29,64 +30,123 @@ PREREQUISITES:
 """
 
 
+# The AWS, Slack and Google Sheets integrations are slow to import (boto3, slackclient, pygsheets and awspricing
+# together take about a second), so each mode imports only the modules it actually uses.
 class Nagbot(object):
-    def notify_internal(self, channel):
-        instances = sqaws.list_ec2_instances()
+    def __init__(self, inventory_path=None, events_source=None, full_scan_hours=None, shard_dir=None, workers=None,
+                 action_deadline_seconds=None, run_id=None):
+        self.inventory_path = inventory_path
+        self.events_source = events_source
+        self.full_scan_hours = full_scan_hours
+        self.shard_dir = shard_dir
+        self.workers = workers
+        self.action_deadline_seconds = action_deadline_seconds
+        self.run_id = run_id
 
-        num_running_instances = sum(1 for i in instances if i.state == 'running')
-        num_total_instances = sum(1 for i in instances)
-        running_monthly_cost = money_to_string(sum(i.monthly_price for i in instances))
 
-        summary_msg = "Hi, I'm Nagbot v{} :wink: My job is to make sure we don't forget about unwanted AWS servers and waste money!\n".format(__version__)
-        summary_msg += "We have {} running EC2 instances right now and {} total.\n".format(num_running_instances,
-                                                                                                num_total_instances)
-        summary_msg += "If we continue to run these instances all month, it would cost {}.\n" \
-            .format(running_monthly_cost)
+    # Get all EC2 instances. By default this is a full scan of every region, but the instances can also come from an
+    # incrementally updated snapshot, from partial results written by sharded scans, or from a pool of worker processes.
+    def list_instances(self):
+        if self.inventory_path is not None:
+            from . import inventory
+            full_scan_hours = self.full_scan_hours or inventory.DEFAULT_FULL_SCAN_HOURS
+            return inventory.update_inventory(self.inventory_path, self.events_source, full_scan_hours)
 
-        # Collect all of the data to a Google Sheet
-        try:
-            header = instances[0].to_header()
-            body = [i.to_list() for i in instances]
-            spreadsheet_url = gdocs.write_to_spreadsheet([header] + body)
-            summary_msg += '\nIf you want to see all the details, I wrote them to a spreadsheet at ' + spreadsheet_url
-            print('Wrote data to Google sheet at URL ' + spreadsheet_url)
-        except Exception as e:
-            print('Failed to write data to Google sheet: ' + str(e))
+        if self.shard_dir is not None:
+            from . import shards
+            return shards.merge_shards(self.shard_dir, self.run_id)
 
-        sqslack.send_message(channel, summary_msg)
+        if self.workers is not None and self.workers > 1:
+            from . import shards
+            return shards.scan_with_workers(self.workers)
 
-        # From here on, exclude "whitelisted" instances
-        all_instances = instances
-        instances = sorted((i for i in instances if not is_whitelisted(i)), key=lambda i: i.name)
+        from . import sqaws
+        return sqaws.list_ec2_instances()
 
-        instances_to_terminate = get_terminatable_instances(instances)
-        if len(instances_to_terminate) > 0:
-            terminate_msg = 'The following %d _stopped_ instances are due to be *TERMINATED*, based on the "Terminate after" tag:\n' % len(instances_to_terminate)
-            for i in instances_to_terminate:
-                contact = sqslack.lookup_user_by_email(i.contact)
-                terminate_msg += make_instance_summary(i) + ', "Terminate after"={}, "Monthly Price"={}, Contact={}\n' \
-                    .format(i.terminate_after, money_to_string(i.monthly_price), contact)
-                sqaws.set_tag(i.region_name, i.instance_id, 'Terminate after',
-                              parsing.add_warning_to_tag(i.terminate_after, TODAY_YYYY_MM_DD))
-        else:
-            terminate_msg = 'No instances are due to be terminated at this time.\n'
-        sqslack.send_message(channel, terminate_msg)
 
-        instances_to_stop = get_stoppable_instances(instances)
-        if len(instances_to_stop) > 0:
-            stop_msg ='The following %d _running_ instances are due to be *STOPPED*, based on the "Stop after" tag:\n' % len(instances_to_stop)
-            for i in instances_to_stop:
-                contact = sqslack.lookup_user_by_email(i.contact)
-                stop_msg += make_instance_summary(i) + ', "Stop after"={}, "Monthly Price"={}, Contact={}\n' \
-                    .format(i.stop_after, money_to_string(i.monthly_price), contact)
-                sqaws.set_tag(i.region_name, i.instance_id, 'Stop after',
-                              parsing.add_warning_to_tag(i.stop_after, TODAY_YYYY_MM_DD, replace=True))
-        else:
-            stop_msg = 'No instances are due to be stopped at this time.\n'
-        sqslack.send_message(channel, stop_msg)
+    # Run forever, stopping and terminating each instance as soon as it is safe, instead of once a day
+    def schedule(self, channel):
+        from . import actions
+        from . import scheduler
+
+        scheduler.Scheduler(channel, self.list_instances,
+                            action_deadline_seconds=self.action_deadline_seconds or actions.DEFAULT_DEADLINE_SECONDS) \
+            .run()
+
+
+    # Print what notify and execute would do over a saved inventory snapshot, without touching AWS or Slack
+    def simulate(self, start_date, days):
+        from . import inventory
+        from . import simulate
+
+        instances = inventory.load_instances(self.inventory_path)
+        results = simulate.simulate(instances, start_date, days)
+        for r in results:
+            print(r.describe())
+        print(simulate.make_summary(results, start_date, days))
+
+
+    # Scan one shard of the AWS regions and write the results to a file, to be merged by a later notify or execute
+    def scan(self, shard):
+        from . import shards
+
+        shard_index, shard_count = shards.parse_shard(shard)
+        path = shards.scan_shard(self.shard_dir, shard_index, shard_count, self.run_id)
+        print('Wrote partial results for shard %s to %s' % (shard, path))
+
+
+    # Notify runs as a pipeline: the Google Sheet upload, the history database and the two tagging/report branches
+    # don't depend on each other, so they all run at once. The Slack messages are still posted in the usual order.
+    def notify_internal(self, channel):
+        from . import sqslack
+
+        instances = self.list_instances()
+
+        cost_report = costs.aggregate_costs(instances, top_n=TOP_N)
+        running = cost_report.state('running')
+        stopped = cost_report.state('stopped')
+
+        summary_msg = "Hi, I'm Nagbot v{} :wink: My job is to make sure we don't forget about unwanted AWS servers and waste money!\n".format(__version__)
+        summary_msg += "We have {} running EC2 instances right now and {} total.\n".format(running.count,
+                                                                                                cost_report.total.count)
+        summary_msg += "If we continue to run these instances all month, it would cost {}.\n" \
+            .format(money_to_string(cost_report.total.monthly_price))
+        summary_msg += "Running instances cost {} per month, and stopped instances still cost {} for storage.\n" \
+            .format(money_to_string(running.monthly_price), money_to_string(stopped.monthly_price))
+        summary_msg += make_top_spenders_summary(cost_report)
+
+        # From here on, exclude "whitelisted" instances
+        not_whitelisted = sorted((i for i in instances if not is_whitelisted(i)), key=lambda i: i.name)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            spreadsheet_future = executor.submit(write_spreadsheet, instances, cost_report)
+            history_future = executor.submit(write_history, instances)
+            terminate_future = executor.submit(warn_terminatable_instances, get_terminatable_instances(not_whitelisted))
+            stop_future = executor.submit(warn_stoppable_instances, get_stoppable_instances(not_whitelisted))
+
+            spreadsheet_url = spreadsheet_future.result()
+            if spreadsheet_url is not None:
+                summary_msg += '\nIf you want to see all the details, I wrote them to a spreadsheet at ' + spreadsheet_url
+            sqslack.send_message(channel, summary_msg)
+
+            # If one branch fails, still post the others (the stop warnings may already be tagged), then re-raise
+            errors = []
+            for future in [terminate_future, stop_future]:
+                try:
+                    sqslack.send_lines(channel, future.result())
+                except Exception as e:
+                    errors.append(e)
+            try:
+                history_future.result()
+            except Exception as e:
+                errors.append(e)
+            if len(errors) > 0:
+                raise errors[0]
 
 
     def notify(self, channel):
+        from . import sqslack
+
         try:
             self.notify_internal(channel)
         except Exception as e:
@@ -95,41 +155,60 @@ class Nagbot(object):
 
 
     def execute_internal(self, channel):
-        instances = sqaws.list_ec2_instances()
+        from . import actions
+        from . import sqaws
+        from . import sqslack
+
+        instances = self.list_instances()
 
         # Only terminate instances which still meet the criteria for terminating, AND were warned several times
-        instances_to_terminate = get_terminatable_instances(instances)
-        instances_to_terminate = [i for i in instances_to_terminate if is_safe_to_terminate(i)]
+        # Use the time as well as the date, so that tags which expire later today are left for a later run
+        instances_to_terminate = get_terminatable_instances(instances, NOW_YYYY_MM_DD_HH_MM)
+        instances_to_terminate = [i for i in instances_to_terminate if is_safe_to_terminate(i, NOW_YYYY_MM_DD_HH_MM)]
 
         # Only stop instances which still meet the criteria for stopping, AND were warned recently
-        instances_to_stop = get_stoppable_instances(instances)
-        instances_to_stop = [i for i in instances_to_stop if is_safe_to_stop(i)]
-
-        if len(instances_to_terminate) > 0:
-            message = 'I terminated the following instances: '
-            for i in instances_to_terminate:
+        instances_to_stop = get_stoppable_instances(instances, NOW_YYYY_MM_DD_HH_MM)
+        instances_to_stop = [i for i in instances_to_stop if is_safe_to_stop(i, NOW_YYYY_MM_DD_HH_MM)]
+
+        # A snapshot can lag behind reality, so make sure each instance is still in the state the snapshot says
+        if self.inventory_path is not None:
+            instances_to_terminate = confirm_states(instances_to_terminate, 'stopped')
+            instances_to_stop = confirm_states(instances_to_stop, 'running')
+
+        results = actions.run_actions([(i, actions.TERMINATE) for i in instances_to_terminate] +
+                                      [(i, actions.STOP) for i in instances_to_stop],
+                                      deadline_seconds=self.action_deadline_seconds or actions.DEFAULT_DEADLINE_SECONDS)
+        terminate_results = [r for r in results if r.action == actions.TERMINATE]
+        stop_results = [r for r in results if r.action == actions.STOP]
+
+        if len(terminate_results) > 0:
+            lines = ['I terminated the following instances:']
+            for r in terminate_results:
+                i = r.instance
                 contact = sqslack.lookup_user_by_email(i.contact)
-                message = message + make_instance_summary(i) + ', "Terminate after"={}, "Monthly Price"={}, Contact={}\n' \
-                    .format(i.terminate_after, money_to_string(i.monthly_price), contact)
-                sqaws.terminate_instance(i.region_name, i.instance_id)
-            sqslack.send_message(channel, message)
+                lines.append(make_instance_summary(i) + ', "Terminate after"={}, "Monthly Price"={}, Contact={}, Result={}'
+                             .format(i.terminate_after, money_to_string(i.monthly_price), contact, r.describe()))
+            sqslack.send_lines(channel, lines)
         else:
             sqslack.send_message(channel, 'No instances were terminated today.')
 
-        if len(instances_to_stop) > 0:
-            message = 'I stopped the following instances: '
-            for i in instances_to_stop:
+        if len(stop_results) > 0:
+            lines = ['I stopped the following instances:']
+            for r in stop_results:
+                i = r.instance
                 contact = sqslack.lookup_user_by_email(i.contact)
-                message = message + make_instance_summary(i) + ', "Stop after"={}, "Monthly Price"={}, Contact={}\n' \
-                    .format(i.stop_after, money_to_string(i.monthly_price), contact)
-                sqaws.stop_instance(i.region_name, i.instance_id)
-                sqaws.set_tag(i.region_name, i.instance_id, 'Nagbot State', 'Stopped on ' + TODAY_YYYY_MM_DD)
-            sqslack.send_message(channel, message)
+                lines.append(make_instance_summary(i) + ', "Stop after"={}, "Monthly Price"={}, Contact={}, Result={}'
+                             .format(i.stop_after, money_to_string(i.monthly_price), contact, r.describe()))
+                if r.requested:
+                    sqaws.set_tag(i.region_name, i.instance_id, 'Nagbot State', 'Stopped on ' + TODAY_YYYY_MM_DD)
+            sqslack.send_lines(channel, lines)
         else:
             sqslack.send_message(channel, 'No instances were stopped today.')
 
 
     def execute(self, channel):
+        from . import sqslack
+
         try:
             self.execute_internal(channel)
         except Exception as e:
@@ -137,29 +216,134 @@ class Nagbot(object):
             raise(e)
 
 
-def get_stoppable_instances(instances):
-    return list(i for i in instances if is_stoppable(i))
-
-
-def is_stoppable(instance):
+# Keep only the instances which are really in the expected state right now, according to EC2
+def confirm_states(instances, expected_state):
+    from . import sqaws
+
+    by_region = dict()
+    for i in instances:
+        by_region.setdefault(i.region_name, []).append(i)
+    confirmed = []
+    for region_name, region_instances in by_region.items():
+        states = sqaws.describe_instance_states(region_name, [i.instance_id for i in region_instances])
+        for i in region_instances:
+            if states.get(i.instance_id) == expected_state:
+                confirmed.append(i)
+            else:
+                print('Skipping %s, which is %s rather than %s' % (i.instance_id, states.get(i.instance_id),
+                                                                   expected_state))
+    return confirmed
+
+
+# Collect all of the data to a Google Sheet. Returns the URL of the sheet, or None if it couldn't be written.
+def write_spreadsheet(instances, cost_report):
+    from . import gdocs
+
+    try:
+        header = instances[0].to_header()
+        body = [i.to_list() for i in instances]
+        spreadsheet_url = gdocs.write_to_spreadsheet([header] + body, cost_report.to_rows())
+        print('Wrote data to Google sheet at URL ' + spreadsheet_url)
+        return spreadsheet_url
+    except Exception as e:
+        print('Failed to write data to Google sheet: ' + str(e))
+        return None
+
+
+# Keep a local history of every run, for looking at trends over time
+def write_history(instances):
+    from . import history
+
+    try:
+        conn = history.connect()
+        history.write_snapshot(conn, TODAY_YYYY_MM_DD, instances)
+        conn.close()
+        print('Wrote %d instances to history database' % len(instances))
+    except Exception as e:
+        print('Failed to write history database: ' + str(e))
+
+
+# Add a warning to the "Terminate after" tag of each instance, and return the lines of the Slack message about them
+def warn_terminatable_instances(instances_to_terminate):
+    from . import sqaws
+    from . import sqslack
+
+    if len(instances_to_terminate) == 0:
+        return ['No instances are due to be terminated at this time.']
+    lines = ['The following %d _stopped_ instances are due to be *TERMINATED*, based on the "Terminate after" tag:' % len(instances_to_terminate)]
+    for i in instances_to_terminate:
+        contact = sqslack.lookup_user_by_email(i.contact)
+        lines.append(make_instance_summary(i) + ', "Terminate after"={}, "Monthly Price"={}, Contact={}'
+                     .format(i.terminate_after, money_to_string(i.monthly_price), contact))
+        sqaws.set_tag(i.region_name, i.instance_id, 'Terminate after',
+                      parsing.add_warning_to_tag(i.terminate_after, TODAY_YYYY_MM_DD))
+    return lines
+
+
+# Add a warning to the "Stop after" tag of each instance, and return the lines of the Slack message about them
+def warn_stoppable_instances(instances_to_stop):
+    from . import sqaws
+    from . import sqslack
+
+    if len(instances_to_stop) == 0:
+        return ['No instances are due to be stopped at this time.']
+    lines = ['The following %d _running_ instances are due to be *STOPPED*, based on the "Stop after" tag:' % len(instances_to_stop)]
+    for i in instances_to_stop:
+        contact = sqslack.lookup_user_by_email(i.contact)
+        lines.append(make_instance_summary(i) + ', "Stop after"={}, "Monthly Price"={}, Contact={}'
+                     .format(i.stop_after, money_to_string(i.monthly_price), contact))
+        sqaws.set_tag(i.region_name, i.instance_id, 'Stop after',
+                      parsing.add_warning_to_tag(i.stop_after, TODAY_YYYY_MM_DD, replace=True))
+    return lines
+
+
+# The policy functions below take an optional "today", which defaults to the current date. It may also include a time
+# of day, like "2019-12-31 17:00", to evaluate tags which expire at a certain hour. Given a date alone, a tag which
+# expires at any time that day counts as expired, so that 'notify' warns about it on the day. Given a time, the tag has
+# to actually be past its hour, so that 'execute' and the scheduler don't act early.
+def get_stoppable_instances(instances, today=None):
+    return list(i for i in instances if is_stoppable(i, today))
+
+
+def is_stoppable(instance, today=None):
+    today = today or TODAY_YYYY_MM_DD
     parsed_date: parsing.ParsedDate = parsing.parse_date_tag(instance.stop_after)
 
     return instance.state == 'running' and (
             (parsed_date.expiry_date is None) # Treat unspecified "Stop after" dates as being in the past
-            or (TODAY_IS_WEEKEND and parsed_date.on_weekends) \
-            or (TODAY_YYYY_MM_DD >= parsed_date.expiry_date))
+            or (is_weekend(today) and parsed_date.on_weekends) \
+            or has_expired(parsed_date.expiry_date, today))
 
 
-def get_terminatable_instances(instances):
-    return list(i for i in instances if is_terminatable(i))
+def get_terminatable_instances(instances, today=None):
+    return list(i for i in instances if is_terminatable(i, today))
 
 
-def is_terminatable(instance):
+def is_terminatable(instance, today=None):
+    today = today or TODAY_YYYY_MM_DD
     parsed_date: parsing.ParsedDate = parsing.parse_date_tag(instance.terminate_after)
 
     # For now, we'll only terminate instances which have an explicit 'Terminate after' tag
     return instance.state == 'stopped' and (
-            (parsed_date.expiry_date is not None and TODAY_YYYY_MM_DD >= parsed_date.expiry_date))
+            (parsed_date.expiry_date is not None and has_expired(parsed_date.expiry_date, today)))
+
+
+# Dates and times in this format compare correctly as strings. Only compare as much of the expiry date as "today" has,
+# so "2019-12-31 17:00" has expired by "2019-12-31" but not by "2019-12-31 09:00".
+def has_expired(expiry_date, today):
+    return today >= expiry_date[:len(today)]
+
+
+@functools.lru_cache(maxsize=1024)
+def is_weekend(today):
+    return parsing.parse_date_time(today).weekday() >= 4  # Days are 0-6. 4=Friday, 5=Saturday, 6=Sunday, 0=Monday
+
+
+# Instances must have been warned at least this long ago before they can be terminated
+@functools.lru_cache(maxsize=1024)
+def get_min_termination_warning(today):
+    min_warning = parsing.parse_date_time(today) - timedelta(days=TERMINATION_WARNING_DAYS)
+    return min_warning.strftime('%Y-%m-%d %H:%M' if len(today) > len('YYYY-MM-DD') else '%Y-%m-%d')
 
 
 # Some instances are whitelisted from stop or terminate actions. These won't show up as recommended to stop/terminate.
@@ -170,21 +354,18 @@ def is_whitelisted(instance):
     return False
 
 
-# Convert floating point dollars to a readable string
-def money_to_string(str):
-    return '${:.2f}'.format(str)
-
-
-def is_safe_to_stop(instance):
+def is_safe_to_stop(instance, today=None):
+    today = today or TODAY_YYYY_MM_DD
     warning_date = parsing.parse_date_tag(instance.stop_after).warning_date
-    return is_stoppable(instance) \
-           and warning_date is not None and warning_date <= TODAY_YYYY_MM_DD;
+    return is_stoppable(instance, today) \
+           and warning_date is not None and warning_date <= today;
 
 
-def is_safe_to_terminate(instance):
+def is_safe_to_terminate(instance, today=None):
+    today = today or TODAY_YYYY_MM_DD
     warning_date = parsing.parse_date_tag(instance.terminate_after).warning_date
-    return is_terminatable(instance) \
-           and warning_date is not None and warning_date <= MIN_TERMINATION_WARNING_YYYY_MM_DD;
+    return is_terminatable(instance, today) \
+           and warning_date is not None and warning_date <= get_min_termination_warning(today);
 
 
 def make_instance_summary(instance):
@@ -199,6 +380,18 @@ def make_instance_summary(instance):
     return line
 
 
+def make_top_spenders_summary(cost_report):
+    lines = ['\nThe most expensive instances are:']
+    for i in cost_report.top_instances:
+        lines.append('{}, "Monthly Price"={}, Contact={}'.format(make_instance_summary(i),
+                                                                 money_to_string(i.monthly_price), i.contact))
+    lines.append('\nThe biggest spenders are:')
+    for contact, group in cost_report.top_contacts:
+        lines.append('{}: {} instances, "Monthly Price"={}'.format(contact or '(no contact)', group.count,
+                                                                   money_to_string(group.monthly_price)))
+    return '\n'.join(lines) + '\n'
+
+
 def url_from_instance_id(region_name, instance_id):
     return 'https://{}.console.aws.amazon.com/ec2/v2/home?region={}#Instances:search={}'.format(region_name, region_name, instance_id)
 
@@ -215,23 +408,47 @@ def main(args):
         sys.exit(1)
     print('Destination Slack channel is: ' + channel)
 
-    nagbot = Nagbot()
+    if mode.lower() == 'simulate':
+        if args.inventory is None or parsing.parse_date(args.today) is None:
+            print('The "simulate" mode requires the --inventory option, and --today must look like YYYY-MM-DD')
+            sys.exit(1)
+    elif (args.inventory is None) != (args.events is None):
+        print('The --inventory and --events options must be used together')
+        sys.exit(1)
+
+    if mode.lower() == 'scan' and (args.shard is None or args.shard_dir is None):
+        print('The "scan" mode requires the --shard and --shard-dir options')
+        sys.exit(1)
+
+    nagbot = Nagbot(inventory_path=args.inventory, events_source=args.events, full_scan_hours=args.full_scan_hours,
+                    shard_dir=args.shard_dir, workers=args.workers, action_deadline_seconds=args.deadline,
+                    run_id=args.run_id)
 
     if mode.lower() == 'notify':
         nagbot.notify(channel)
     elif mode.lower() == 'execute':
         nagbot.execute(channel)
+    elif mode.lower() == 'scan':
+        nagbot.scan(args.shard)
+    elif mode.lower() == 'schedule':
+        nagbot.schedule(channel)
+    elif mode.lower() == 'simulate':
+        nagbot.simulate(args.today, args.days)
     else:
-        print('Unexpected mode "%s", should be "notify" or "execute"' % mode)
+        print('Unexpected mode "%s", should be "notify", "execute", "scan", "schedule" or "simulate"' % mode)
         sys.exit(1)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        "mode", help="Mode, either 'notify' or 'execute'. "
+        "mode", help="Mode, either 'notify', 'execute', 'scan', 'schedule' or 'simulate'. "
         "In 'notify' mode, a notification is posted to Slack. "
-        "In 'execute' mode, instances are stopped or terminated.")
+        "In 'execute' mode, instances are stopped or terminated. "
+        "In 'scan' mode, one shard of the AWS regions is scanned and written to --shard-dir. "
+        "In 'schedule' mode, Nagbot keeps running and stops or terminates each instance as soon as it is safe. "
+        "In 'simulate' mode, the actions of 'notify' and 'execute' are printed for the --inventory snapshot, "
+        "without changing anything.")
 
     parser.add_argument(
         "-c",
@@ -240,5 +457,65 @@ if __name__ == "__main__":
         default='#nagbot-testing',
         help="Which Slack channel to publish to")
 
+    parser.add_argument(
+        "--inventory",
+        action="store",
+        help="Keep the EC2 inventory in this snapshot file, updated from --events instead of scanning every region. "
+        "In 'simulate' mode, the snapshot to simulate.")
+
+    parser.add_argument(
+        "--events",
+        action="store",
+        help="SQS queue URL or local JSON-lines file of EC2 state-change and tag change events")
+
+    parser.add_argument(
+        "--full-scan-hours",
+        action="store",
+        type=float,
+        help="With --inventory, how often to do a full scan of every region to reconcile the snapshot (default: 24)")
+
+    parser.add_argument(
+        "--shard",
+        action="store",
+        help="In 'scan' mode, which shard of the AWS regions to scan, like 0/4")
+
+    parser.add_argument(
+        "--shard-dir",
+        action="store",
+        help="Directory for partial results of sharded scans. "
+        "In 'notify' and 'execute' mode, the partial results are merged instead of scanning.")
+
+    parser.add_argument(
+        "--run-id",
+        action="store",
+        help="With --shard-dir, which run the partial results belong to, so results from other runs are never used. "
+        "Every 'scan' and the 'notify' or 'execute' that merges them must use the same run ID (default: today's date)")
+
+    parser.add_argument(
+        "--workers",
+        action="store",
+        type=int,
+        help="Scan the AWS regions with this many worker processes")
+
+    parser.add_argument(
+        "--deadline",
+        action="store",
+        type=float,
+        help="In 'execute' mode, how many seconds to wait for instances to finish stopping or terminating "
+        "(default: 600)")
+
+    parser.add_argument(
+        "--today",
+        action="store",
+        default=TODAY_YYYY_MM_DD,
+        help="In 'simulate' mode, the first day to simulate, like 2019-12-31 (default: today)")
+
+    parser.add_argument(
+        "--days",
+        action="store",
+        type=int,
+        default=1,
+        help="In 'simulate' mode, how many days to simulate (default: 1)")
+
     args = parser.parse_args()
     main(args)
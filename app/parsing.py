@@ -1,3 +1,5 @@
+import dataclasses
+import functools
 import re
 from dataclasses import dataclass
 from datetime import datetime
@@ -18,9 +20,20 @@ def date_to_string(datetime: datetime) -> str:
     return datetime.strftime('%Y-%m-%d')
 
 
-@dataclass
+# Return a datetime.datetime for a date with an optional time, like "2019-12-31" or "2019-12-31 17:00",
+# or None if the string is not in either format
+def parse_date_time(str: str) -> datetime:
+    for format in ['%Y-%m-%d %H:%M', '%Y-%m-%d']:
+        try:
+            return datetime.strptime(str, format)
+        except:
+            pass
+    return None
+
+
+@dataclass(frozen=True)
 class ParsedDate:
-    expiry_date: str   # Looks like: 2019-12-31
+    expiry_date: str   # Looks like: 2019-12-31, or 2019-12-31 17:00 for instances which expire at a certain hour
     on_weekends: bool
     warning_date: str  # Looks like: 2019-12-31
 
@@ -38,28 +51,35 @@ class ParsedDate:
 
 
 
+# Tags are parsed over and over by the policy functions, and most instances share a handful of tag values, so the
+# results are cached. ParsedDate is frozen, so a cached result can't be modified by accident.
+@functools.lru_cache(maxsize=65536)
 def parse_date_tag(date_tag: str) -> ParsedDate:
-    parsed_date = ParsedDate(None, False, None)
+    expiry_date = None
+    on_weekends = False
+    warning_date = None
 
-    match = re.match(r'^(\d{4}-\d{2}-\d{2})', date_tag)
+    # The time of day is local time, on whatever machine Nagbot runs on. Anything after it, like a "Z" or "+02:00"
+    # zone suffix, is ignored. A time which isn't valid, like "25:00", is ignored too, leaving just the date.
+    match = re.match(r'^(\d{4}-\d{2}-\d{2})(?:[ T]([01]?\d|2[0-3]):([0-5]\d)(?!\d))?', date_tag)
     if match:
-        expiry_date = datetime.strptime(match.group(1), '%Y-%m-%d')
-        parsed_date.expiry_date = date_to_string(expiry_date)
+        expiry_date = date_to_string(datetime.strptime(match.group(1), '%Y-%m-%d'))
+        if match.group(2) is not None:
+            expiry_date += ' {:02d}:{}'.format(int(match.group(2)), match.group(3))
 
     match = re.match(r'^On Weekends', date_tag, re.IGNORECASE)
     if match:
-        parsed_date.on_weekends = True
+        on_weekends = True
 
     match = re.match(r'.*\(Nagbot: Warned on (\d{4}-\d{2}-\d{2})\)$', date_tag)
     if match:
-        warning_date = datetime.strptime(match.group(1), '%Y-%m-%d')
-        parsed_date.warning_date = date_to_string(warning_date)
+        warning_date = date_to_string(datetime.strptime(match.group(1), '%Y-%m-%d'))
 
-    return parsed_date
+    return ParsedDate(expiry_date, on_weekends, warning_date)
 
 
 def add_warning_to_tag(old_date_tag: str, warning_date: str, replace=False) -> str:
     parsed_date = parse_date_tag(old_date_tag)
     if parsed_date.warning_date is None or replace:
-        parsed_date.warning_date = warning_date
+        parsed_date = dataclasses.replace(parsed_date, warning_date=warning_date)
     return str(parsed_date)
\ No newline at end of file
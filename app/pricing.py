@@ -0,0 +1,251 @@
+import argparse
+import bisect
+import csv
+import io
+import mmap
+import multiprocessing
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+"""
+A compact on-demand price catalog for EC2. The AWS bulk price list for EC2 is several gigabytes, and parsing all of it
+into memory (as awspricing does) is slow and uses a lot of memory. Instead, the CSV edition of the price list is read
+one row at a time, only the on-demand Linux and Windows prices for the regions we use are kept, and they are written
+to a small sorted binary file. Lookups do a binary search over a memory-mapped view of that file.
+"""
+
+OFFER_CSV_URL = 'https://pricing.us-east-1.amazonaws.com/offers/v1.0/aws/AmazonEC2/current/index.csv'
+DEFAULT_CATALOG_PATH = 'nagbot-prices.bin'
+MAX_CATALOG_AGE_DAYS = 7
+MAX_REFRESH_LOCK_AGE_SECONDS = 2 * 60 * 60  # A refresh which has been running this long must have died
+OPERATING_SYSTEMS = ['Linux', 'Windows']
+
+# File layout: a header, followed by fixed size records sorted by key. A key looks like "us-east-1|m4.xlarge|Linux".
+MAGIC = b'NAGPRC01'
+HEADER = struct.Struct('<8sI')  # Magic, number of records
+RECORD = struct.Struct('<48sd')  # Key padded with zero bytes, hourly price in USD
+KEY_SIZE = 48
+
+
+def get_catalog_path() -> str:
+    return os.environ.get('NAGBOT_PRICE_CATALOG', DEFAULT_CATALOG_PATH)
+
+
+def make_key(region_name: str, instance_type: str, operating_system: str) -> bytes:
+    return '|'.join([region_name, instance_type, operating_system]).encode('ascii')
+
+
+# Read the rows of the EC2 price list CSV and keep only the on-demand hourly prices we care about.
+# The file starts with a few lines of metadata before the header row.
+def parse_offer_csv(lines, region_names=None) -> dict:
+    reader = csv.reader(lines)
+    for row in reader:
+        if len(row) > 0 and row[0] == 'SKU':
+            columns = {name: index for index, name in enumerate(row)}
+            break
+    else:
+        raise ValueError('The price list has no header row')
+
+    term_type = columns['TermType']
+    unit = columns['Unit']
+    price_per_unit = columns['PricePerUnit']
+    currency = columns['Currency']
+    region_code = columns['Region Code']
+    instance_type = columns['Instance Type']
+    operating_system = columns['Operating System']
+    tenancy = columns['Tenancy']
+    preinstalled_software = columns['Pre Installed S/W']
+    license_model = columns['License Model']
+    capacity_status = columns['CapacityStatus']
+
+    # These match the defaults awspricing uses for ondemand_hourly()
+    prices = dict()
+    for row in reader:
+        if row[term_type] != 'OnDemand' or row[unit] != 'Hrs' or row[currency] != 'USD' \
+                or row[tenancy] != 'Shared' or row[preinstalled_software] != 'NA' \
+                or row[license_model] != 'No License required' or row[capacity_status] != 'Used' \
+                or row[operating_system] not in OPERATING_SYSTEMS:
+            continue
+        if region_names is not None and row[region_code] not in region_names:
+            continue
+        key = make_key(row[region_code], row[instance_type], row[operating_system])
+        if len(key) <= KEY_SIZE:
+            prices.setdefault(key, float(row[price_per_unit]))
+    return prices
+
+
+# Write to a uniquely named temporary file and then rename it, so that concurrent writers never share a temporary file
+# and a reader never sees a partly written catalog
+def write_catalog(path: str, prices: dict) -> None:
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(prices)))
+            for key in sorted(prices):
+                f.write(RECORD.pack(key, prices[key]))
+        # Replacing the file doesn't disturb any process which still has the old one memory-mapped
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+# Download the price list and build the catalog. The download is streamed, so memory use stays small.
+def refresh_catalog(path: str = None, region_names=None, url: str = OFFER_CSV_URL) -> int:
+    path = path or get_catalog_path()
+    print('Downloading EC2 prices from ' + url)
+    with urllib.request.urlopen(url) as response:
+        prices = parse_offer_csv(io.TextIOWrapper(response, encoding='utf-8', newline=''), region_names)
+    write_catalog(path, prices)
+    print('Wrote %d EC2 prices to %s' % (len(prices), path))
+    return len(prices)
+
+
+class PriceCatalog(object):
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC or HEADER.size + self.count * RECORD.size != len(self.mmap):
+            raise ValueError('%s is not a valid price catalog' % path)
+
+    # Allow bisect to treat the records as a sorted list of keys
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> bytes:
+        offset = HEADER.size + index * RECORD.size
+        return self.mmap[offset:offset + KEY_SIZE]
+
+    # Return the hourly price, or None if it isn't in the catalog
+    def lookup_hourly(self, region_name: str, instance_type: str, operating_system: str) -> float:
+        key = make_key(region_name, instance_type, operating_system).ljust(KEY_SIZE, b'\0')
+        index = bisect.bisect_left(self, key)
+        if index < self.count and self[index] == key:
+            return RECORD.unpack_from(self.mmap, HEADER.size + index * RECORD.size)[1]
+        return None
+
+
+_catalog = None
+_catalog_unavailable = False  # Set once building or opening the catalog has failed, so we don't keep retrying
+_catalog_lock = threading.RLock()
+_refresh_process = None
+
+
+def is_stale(path: str) -> bool:
+    return time.time() - os.path.getmtime(path) > MAX_CATALOG_AGE_DAYS * 24 * 60 * 60
+
+
+# Worker processes (like the ones for --workers) never build or refresh the catalog themselves. The parent process
+# does that before starting them, and otherwise every worker would download the price list at once.
+def is_worker_process() -> bool:
+    return multiprocessing.parent_process() is not None
+
+
+def get_region_name_set(get_region_names=None) -> set:
+    return set(get_region_names()) if get_region_names is not None else None
+
+
+def get_lock_path(path: str) -> str:
+    return path + '.refreshing'
+
+
+# Create the lock file for refreshing the catalog, returning False if another refresh already holds it
+def acquire_refresh_lock(lock_path: str) -> bool:
+    for _ in range(2):
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) <= MAX_REFRESH_LOCK_AGE_SECONDS:
+                    return False
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+    return False
+
+
+def release_refresh_lock(lock_path: str) -> None:
+    try:
+        os.remove(lock_path)
+    except FileNotFoundError:
+        pass
+
+
+# Refresh the catalog in a separate process, at most once per process. The process is detached, so that it carries on
+# after a short run like 'notify' exits, which would kill a thread part way through the download. Its output goes to
+# a log file next to the catalog, and a lock file stops overlapping runs from each starting a refresh.
+# get_region_names is an optional function returning the regions to keep prices for.
+def refresh_in_background(path: str, get_region_names=None) -> None:
+    global _refresh_process
+    with _catalog_lock:
+        path = os.path.abspath(path)
+        lock_path = get_lock_path(path)
+        if _refresh_process is not None or not acquire_refresh_lock(lock_path):
+            return
+
+        try:
+            command = [sys.executable, '-m', 'app.pricing', '--catalog', path, '--lock', lock_path]
+            region_names = get_region_name_set(get_region_names)
+            if region_names is not None:
+                command += ['--regions'] + sorted(region_names)
+            with open(path + '.log', 'a') as log:
+                package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+                _refresh_process = subprocess.Popen(command, cwd=package_dir, stdin=subprocess.DEVNULL, stdout=log,
+                                                    stderr=subprocess.STDOUT, start_new_session=True)
+            print('Refreshing the EC2 price catalog in process %d, logging to %s.log' % (_refresh_process.pid, path))
+        except Exception as e:
+            print('Failed to start refreshing the EC2 price catalog: ' + str(e))
+            release_refresh_lock(lock_path)
+
+
+# Get the price catalog, or None if it isn't available, in which case prices have to come from awspricing instead.
+# If the catalog is missing, it is built right away, streaming the price list. If it is stale, it is used as it is
+# and refreshed in the background.
+def get_catalog(get_region_names=None) -> PriceCatalog:
+    global _catalog, _catalog_unavailable
+    with _catalog_lock:
+        if _catalog is not None or _catalog_unavailable:
+            return _catalog
+        path = get_catalog_path()
+
+        if not os.path.exists(path):
+            if is_worker_process():
+                _catalog_unavailable = True
+                return None
+            try:
+                refresh_catalog(path, get_region_name_set(get_region_names))
+            except Exception as e:
+                print('Failed to build the EC2 price catalog, using awspricing instead: ' + str(e))
+                _catalog_unavailable = True
+                return None
+        elif is_stale(path) and not is_worker_process():
+            refresh_in_background(path, get_region_names)
+
+        try:
+            _catalog = PriceCatalog(path)
+        except (OSError, ValueError) as e:
+            print('Failed to open the EC2 price catalog, using awspricing instead: ' + str(e))
+            _catalog_unavailable = True
+        return _catalog
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the EC2 price catalog from the AWS bulk price list')
+    parser.add_argument('--regions', nargs='*', help='Only keep prices for these regions (default: all)')
+    parser.add_argument('--catalog', help='Where to write the catalog (default: $NAGBOT_PRICE_CATALOG or %s)'
+                        % DEFAULT_CATALOG_PATH)
+    parser.add_argument('--lock', help='A lock file to remove when done, as created by refresh_in_background()')
+    args = parser.parse_args()
+    try:
+        refresh_catalog(args.catalog, set(args.regions) if args.regions else None)
+    finally:
+        if args.lock:
+            release_refresh_lock(args.lock)
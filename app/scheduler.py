@@ -0,0 +1,156 @@
+import heapq
+import time
+from datetime import datetime, timedelta
+
+from . import actions
+from . import nagbot
+from . import parsing
+from . import sqaws
+from . import sqslack
+
+"""
+A deadline-indexed scheduler for stopping and terminating instances as soon as it is safe, instead of waiting for the
+next daily 'execute' run. Every tracked instance which has been warned is put in a priority queue, keyed by the time at
+which it becomes safe to stop or terminate. The scheduler sleeps until the earliest deadline, re-checks just that
+instance, and acts on it. The inventory is only rescanned periodically, to pick up new instances and tags.
+Deadlines are compared with the local clock, so tag times are taken as local time (see parsing.parse_date_tag()).
+"""
+
+DEFAULT_RESCAN_MINUTES = 60
+MAX_SLEEP_SECONDS = 15 * 60
+ERROR_BACKOFF_SECONDS = 60  # Doubled after each consecutive failure, up to MAX_SLEEP_SECONDS
+
+
+def now_string(now: datetime) -> str:
+    return now.strftime('%Y-%m-%d %H:%M')
+
+
+# When an instance becomes safe to stop, as a date or date and time string, or None if it never will without changes
+def get_stop_deadline(instance) -> str:
+    if instance.state != 'running' or nagbot.is_whitelisted(instance):
+        return None
+    parsed_date = parsing.parse_date_tag(instance.stop_after)
+    if parsed_date.warning_date is None:
+        return None  # Nagbot has to warn about it first
+    if parsed_date.expiry_date is None:
+        return parsed_date.warning_date  # Like is_stoppable(), treat unspecified dates as being in the past
+    return max(parsed_date.expiry_date, parsed_date.warning_date)
+
+
+# When an instance becomes safe to terminate, as a date or date and time string, or None if it never will
+def get_terminate_deadline(instance) -> str:
+    if instance.state != 'stopped' or nagbot.is_whitelisted(instance):
+        return None
+    parsed_date = parsing.parse_date_tag(instance.terminate_after)
+    if parsed_date.expiry_date is None or parsed_date.warning_date is None:
+        return None
+    warned = parsing.parse_date(parsed_date.warning_date) + timedelta(days=nagbot.TERMINATION_WARNING_DAYS)
+    return max(parsed_date.expiry_date, parsing.date_to_string(warned))
+
+
+# Build a heap of (deadline, instance ID, action) for every instance with a stop or terminate deadline
+def build_deadline_index(instances) -> list:
+    index = []
+    for i in instances:
+        stop_deadline = get_stop_deadline(i)
+        if stop_deadline is not None:
+            index.append((stop_deadline, i.instance_id, actions.STOP))
+        terminate_deadline = get_terminate_deadline(i)
+        if terminate_deadline is not None:
+            index.append((terminate_deadline, i.instance_id, actions.TERMINATE))
+    heapq.heapify(index)
+    return index
+
+
+class Scheduler(object):
+    def __init__(self, channel, list_instances, rescan_minutes=DEFAULT_RESCAN_MINUTES,
+                 action_deadline_seconds=actions.DEFAULT_DEADLINE_SECONDS, clock=datetime.now, sleep=time.sleep):
+        self.channel = channel
+        self.list_instances = list_instances
+        self.rescan_interval = timedelta(minutes=rescan_minutes)
+        self.action_deadline_seconds = action_deadline_seconds
+        self.clock = clock
+        self.sleep = sleep
+        self.instances = dict()
+        self.index = []
+        self.next_rescan = None
+
+    def rescan(self) -> None:
+        now = self.clock()
+        instances = self.list_instances()
+        self.instances = {i.instance_id: i for i in instances}
+        self.index = build_deadline_index(instances)
+        self.next_rescan = now + self.rescan_interval
+        print('Tracking %d stop/terminate deadlines for %d instances' % (len(self.index), len(instances)))
+
+    # Act on every instance whose deadline has passed. Returns how many instances were acted on.
+    def run_due(self) -> int:
+        count = 0
+        while len(self.index) > 0 and self.index[0][0] <= now_string(self.clock()):
+            _, instance_id, action = heapq.heappop(self.index)
+            if self.act(self.instances[instance_id], action):
+                count += 1
+        return count
+
+    # Re-check a single instance, in case it changed since the last scan, and stop or terminate it if still safe
+    def act(self, instance, action) -> bool:
+        today = now_string(self.clock())
+        current = sqaws.get_ec2_instance(instance.region_name, instance.instance_id)
+        if current is None:
+            return False
+        self.instances[current.instance_id] = current
+        if action == actions.STOP and not nagbot.is_safe_to_stop(current, today):
+            return False
+        if action == actions.TERMINATE and not nagbot.is_safe_to_terminate(current, today):
+            return False
+
+        result = actions.run_actions([(current, action)], deadline_seconds=self.action_deadline_seconds)[0]
+        if action == actions.STOP:
+            tag = 'Stop after'
+            tag_value = current.stop_after
+            if result.requested:
+                sqaws.set_tag(current.region_name, current.instance_id, 'Nagbot State', 'Stopped on ' + today[:10])
+            message = 'I stopped this instance:'
+        else:
+            tag = 'Terminate after'
+            tag_value = current.terminate_after
+            message = 'I terminated this instance:'
+        contact = sqslack.lookup_user_by_email(current.contact)
+        sqslack.send_message(self.channel, message + '\n' + nagbot.make_instance_summary(current) +
+                             ', "{}"={}, "Monthly Price"={}, Contact={}, Result={}'
+                             .format(tag, tag_value, nagbot.money_to_string(current.monthly_price), contact,
+                                     result.describe()))
+        return result.requested
+
+    # How long to sleep until there might be something to do
+    def get_sleep_seconds(self) -> float:
+        now = self.clock()
+        wake = self.next_rescan
+        if len(self.index) > 0:
+            wake = min(wake, parsing.parse_date_time(self.index[0][0]))
+        return min(max((wake - now).total_seconds(), 0), MAX_SLEEP_SECONDS)
+
+    # Tell the channel about a failure, without letting a Slack failure take down the scheduler too
+    def report_error(self, e: Exception, retry_seconds: float) -> None:
+        message = "Nagbot failed to run the 'schedule' command: {}. Retrying in {:.0f} seconds.".format(e, retry_seconds)
+        print(message)
+        try:
+            sqslack.send_message(self.channel, message)
+        except Exception as slack_error:
+            print('Failed to report the error to Slack: ' + str(slack_error))
+
+    # Run forever. A failure (like AWS throttling or a Slack outage) is reported, and then retried with backoff.
+    def run(self) -> None:
+        failures = 0
+        while True:
+            try:
+                if self.next_rescan is None or self.clock() >= self.next_rescan:
+                    self.rescan()
+                self.run_due()
+                failures = 0
+                sleep_seconds = self.get_sleep_seconds()
+            except Exception as e:
+                failures += 1
+                sleep_seconds = min(ERROR_BACKOFF_SECONDS * 2 ** (failures - 1), MAX_SLEEP_SECONDS)
+                self.report_error(e, sleep_seconds)
+            self.sleep(sleep_seconds)
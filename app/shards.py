@@ -0,0 +1,85 @@
+import glob
+import multiprocessing
+import os
+import re
+from datetime import date
+
+from . import inventory
+from . import pricing
+from . import sqaws
+
+"""
+Sharded scanning of AWS regions. The regions are split deterministically into N shards, so that they can be scanned by
+N worker processes, or by N separate hosts which each write a partial result file. The partial results are then
+merged back into the single list of instances that Nagbot works from. Each partial result file is named with a run ID
+(by default, today's date), so that results left over from an earlier run are never merged by mistake.
+"""
+
+
+# Parse a shard spec like "2/8" into (2, 8). Shards are numbered from 0.
+def parse_shard(shard: str) -> tuple:
+    match = re.fullmatch(r'(\d+)/(\d+)', shard)
+    if match is None:
+        raise ValueError('Unexpected shard format "%s", should look like 0/4' % shard)
+    shard_index, shard_count = int(match.group(1)), int(match.group(2))
+    if shard_count < 1 or shard_index >= shard_count:
+        raise ValueError('Shard index must be between 0 and %d, but was %d' % (shard_count - 1, shard_index))
+    return shard_index, shard_count
+
+
+# Deterministically pick the regions for one shard. Every host sorts the regions the same way, so the shards never
+# overlap and together they cover every region.
+def get_shard_regions(region_names: list, shard_index: int, shard_count: int) -> list:
+    return sorted(region_names)[shard_index::shard_count]
+
+
+def get_run_id(run_id: str = None) -> str:
+    return run_id or date.today().strftime('%Y-%m-%d')
+
+
+def get_shard_path(shard_dir: str, shard_index: int, shard_count: int, run_id: str = None) -> str:
+    return os.path.join(shard_dir, 'shard-{}-{}-of-{}.jsonl'.format(get_run_id(run_id), shard_index, shard_count))
+
+
+# Scan the regions for one shard and write them to a partial result file
+def scan_shard(shard_dir: str, shard_index: int, shard_count: int, run_id: str = None) -> str:
+    region_names = get_shard_regions(sqaws.list_region_names(), shard_index, shard_count)
+    print('Shard {}/{} is scanning regions: {}'.format(shard_index, shard_count, ', '.join(region_names)))
+    instances = sqaws.list_ec2_instances(region_names)
+    os.makedirs(shard_dir, exist_ok=True)
+    path = get_shard_path(shard_dir, shard_index, shard_count, run_id)
+    inventory.save_instances(path, instances)
+    return path
+
+
+# Merge the partial result files written by every shard in one run. Fails if any shard is missing, even if there are
+# results for it from a different run.
+def merge_shards(shard_dir: str, run_id: str = None) -> list:
+    run_id = get_run_id(run_id)
+    paths = glob.glob(os.path.join(glob.escape(shard_dir), 'shard-{}-*-of-*.jsonl'.format(glob.escape(run_id))))
+    shard_counts = {int(re.search(r'-of-(\d+)\.jsonl$', path).group(1)) for path in paths}
+    if len(shard_counts) != 1:
+        raise RuntimeError('Expected partial results from one set of shards for run %s in %s, but found %d'
+                           % (run_id, shard_dir, len(shard_counts)))
+    shard_count = shard_counts.pop()
+
+    missing = [i for i in range(shard_count) if get_shard_path(shard_dir, i, shard_count, run_id) not in paths]
+    if len(missing) > 0:
+        raise RuntimeError('Missing partial results for run %s in %s for shards: %s'
+                           % (run_id, shard_dir, ', '.join('%d/%d' % (i, shard_count) for i in missing)))
+
+    instances = []
+    for i in range(shard_count):
+        instances.extend(inventory.load_instances(get_shard_path(shard_dir, i, shard_count, run_id)))
+    return instances
+
+
+# Scan all regions with a pool of worker processes, one shard per process
+def scan_with_workers(workers: int) -> list:
+    region_names = sqaws.list_region_names()
+    shards = [get_shard_regions(region_names, i, workers) for i in range(workers)]
+    # Make sure the price catalog exists before starting the workers, which only ever read it
+    pricing.get_catalog(lambda: region_names)
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.map(sqaws.list_ec2_instances, shards)
+    return [instance for shard_instances in results for instance in shard_instances]
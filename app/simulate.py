@@ -0,0 +1,153 @@
+import dataclasses
+import functools
+from dataclasses import dataclass
+from datetime import timedelta
+
+from . import nagbot
+from . import parsing
+from .model import Instance, money_to_string
+
+"""
+A dry run of Nagbot's policy over a saved inventory snapshot, for trying out changes to the stop/terminate rules or
+the whitelist without touching AWS or Slack. Each simulated day runs 'execute' and then 'notify', entirely in memory,
+using the same policy functions as the real thing. Warnings update the tags, and stopping or terminating an instance
+updates its state, so later days see the results of earlier ones.
+
+Instances only change on a few days (when a tag expires, when they are warned, and when they are stopped or
+terminated), so rather than checking every instance every day, each one is re-checked only on the next day its
+decisions could change. This makes a year of days over a large snapshot about as fast as a few days.
+"""
+
+WARN_STOP = 'warn-stop'
+WARN_TERMINATE = 'warn-terminate'
+STOP = 'stop'
+TERMINATE = 'terminate'
+ACTION_ORDER = {TERMINATE: 0, STOP: 1, WARN_TERMINATE: 2, WARN_STOP: 3}  # The order of the real Slack messages
+
+
+# Something Nagbot would have done to one instance on one day
+@dataclass
+class SimulatedAction:
+    date: str
+    action: str               # WARN_STOP, WARN_TERMINATE, STOP or TERMINATE
+    instance: Instance        # The instance as it was just before the action
+    monthly_savings: float    # How much less the instance costs per month after the action
+
+    def describe(self) -> str:
+        i = self.instance
+        line = '{}: {} {} "{}" ({})'.format(self.date, self.action, i.instance_id, i.name, i.contact)
+        if self.monthly_savings > 0:
+            line += ', saves {} per month'.format(money_to_string(self.monthly_savings))
+        return line
+
+
+# Run 'execute' for one instance, returning the action taken (if any) and the instance afterwards. Like the real one,
+# it goes by the time of day, which is taken to be the start of the day, so tags expiring during the day wait for the
+# next day.
+def simulate_execute(instance, today):
+    now = today + ' 00:00'
+    if nagbot.is_terminatable(instance, now) and nagbot.is_safe_to_terminate(instance, now):
+        action = SimulatedAction(today, TERMINATE, instance, instance.monthly_price)
+        return action, dataclasses.replace(instance, state='terminated', monthly_price=0.0)
+    if nagbot.is_stoppable(instance, now) and nagbot.is_safe_to_stop(instance, now):
+        action = SimulatedAction(today, STOP, instance, instance.monthly_server_price)
+        return action, dataclasses.replace(instance, state='stopped', nagbot_state='Stopped on ' + today,
+                                           monthly_price=instance.monthly_storage_price)
+    return None, instance
+
+
+# Run 'notify' for one instance, returning the warning given (if any) and the instance afterwards
+def simulate_notify(instance, today):
+    if nagbot.is_whitelisted(instance):
+        return None, instance
+    if nagbot.is_terminatable(instance, today):
+        action = SimulatedAction(today, WARN_TERMINATE, instance, 0.0)
+        return action, dataclasses.replace(instance,
+                                           terminate_after=parsing.add_warning_to_tag(instance.terminate_after, today))
+    if nagbot.is_stoppable(instance, today):
+        action = SimulatedAction(today, WARN_STOP, instance, 0.0)
+        return action, dataclasses.replace(instance,
+                                           stop_after=parsing.add_warning_to_tag(instance.stop_after, today,
+                                                                                 replace=True))
+    return None, instance
+
+
+# Date arithmetic on YYYY-MM-DD strings. There are only a few hundred distinct dates in a simulation, so this is cached.
+@functools.lru_cache(maxsize=4096)
+def add_days(date: str, days: int) -> str:
+    return parsing.date_to_string(parsing.parse_date(date) + timedelta(days=days))
+
+
+# The next date after "today" on which Nagbot's decisions about an instance could change, or None if they never will
+def get_next_check_date(instance, today: str) -> str:
+    tomorrow = add_days(today, 1)
+    whitelisted = nagbot.is_whitelisted(instance)
+
+    if instance.state == 'running':
+        parsed_date = parsing.parse_date_tag(instance.stop_after)
+        if not nagbot.is_stoppable(instance, today):
+            return max(parsed_date.expiry_date[:10], tomorrow)
+        if whitelisted and parsed_date.warning_date is None:
+            return None  # It will never be warned, so it will never be stopped
+        return tomorrow  # Warned today, so it will be stopped tomorrow
+
+    if instance.state == 'stopped':
+        parsed_date = parsing.parse_date_tag(instance.terminate_after)
+        if parsed_date.expiry_date is None:
+            return None
+        if not nagbot.is_terminatable(instance, today):
+            return max(parsed_date.expiry_date[:10], tomorrow)
+        if not whitelisted:
+            return tomorrow  # It's listed in every notify until it's terminated
+        if parsed_date.warning_date is None:
+            return None
+        return max(add_days(parsed_date.warning_date, nagbot.TERMINATION_WARNING_DAYS), tomorrow)
+
+    return None
+
+
+# Simulate "days" days of Nagbot runs starting on "start_date" (YYYY-MM-DD). Returns every action, in date order.
+# The instances passed in are not modified.
+def simulate(instances, start_date: str, days: int = 1) -> list:
+    current = list(instances)
+    dates = [add_days(start_date, n) for n in range(days)]
+    due = {date: [] for date in dates}  # Date -> indexes of the instances to check on that date
+    due[start_date] = list(range(len(current)))
+
+    results = []
+    for today in dates:
+        indexes = sorted(due.pop(today))
+        day_results = []
+        for n in indexes:
+            instance = current[n]
+            for step in (simulate_execute, simulate_notify):
+                action, instance = step(instance, today)
+                if action is not None:
+                    day_results.append(action)
+            current[n] = instance
+
+            next_date = get_next_check_date(instance, today)
+            if next_date is not None and next_date in due:
+                due[next_date].append(n)
+
+        results += sorted(day_results, key=lambda a: ACTION_ORDER[a.action])
+    return results
+
+
+# Summarize simulated actions: how many of each, and the monthly savings from stopping and terminating instances
+def make_summary(results, start_date: str, days: int) -> str:
+    counts = {action: 0 for action in (WARN_STOP, WARN_TERMINATE, STOP, TERMINATE)}
+    savings = {STOP: 0.0, TERMINATE: 0.0}
+    for r in results:
+        counts[r.action] += 1
+        if r.action in savings:
+            savings[r.action] += r.monthly_savings
+
+    lines = ['Simulated {} day(s) starting on {}:'.format(days, start_date),
+             '{} "Stop after" warnings and {} "Terminate after" warnings'.format(counts[WARN_STOP],
+                                                                                 counts[WARN_TERMINATE]),
+             'Stopped {} instances, saving {} per month'.format(counts[STOP], money_to_string(savings[STOP])),
+             'Terminated {} instances, saving {} per month'.format(counts[TERMINATE],
+                                                                   money_to_string(savings[TERMINATE])),
+             'Total savings: {} per month'.format(money_to_string(savings[STOP] + savings[TERMINATE]))]
+    return '\n'.join(lines)
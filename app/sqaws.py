@@ -1,86 +1,39 @@
 import os
-from dataclasses import dataclass
+import threading
 
-import awspricing
 import boto3
 
-os.environ['AWSPRICING_USE_CACHE'] = '1'
+from . import pricing
+from .model import Instance, money_to_string, quote  # Re-exported, since they used to live here
+
 HOURS_IN_A_MONTH = 730
+DESCRIBE_INSTANCES_BATCH_SIZE = 200  # How many instance IDs to ask about in a single describe_instances filter
 
 
-# Convert floating point dollars to a readable string
-def money_to_string(str):
-    return '${:.2f}'.format(str)
-
-
-# Quote a string
-def quote(str):
-    return '"' + str + '"'
-
-
-# Model class for an EC2 instance
-@dataclass
-class Instance:
-    region_name: str
-    instance_id: str
-    state: str
-    reason: str
-    instance_type: str
-    name: str
-    operating_system: str
-    stop_after: str
-    terminate_after: str
-    contact: str
-    nagbot_state: str
-    monthly_price: float
-    monthly_server_price: float
-    monthly_storage_price: float
-
-    def to_header(self) -> str:
-        return ['Instance ID',
-                'Name',
-                'State',
-                'Stop After',
-                'Terminate After',
-                'Contact',
-                'Nagbot State',
-                'Monthly Price',
-                'Monthly Server Price',
-                'Monthly Storage Price',
-                'Region Name',
-                'Instance Type',
-                'Reason',
-                'OS']
-
-    def to_list(self) -> str:
-        return [self.instance_id,
-                self.name,
-                self.state,
-                self.stop_after,
-                self.terminate_after,
-                self.contact,
-                self.nagbot_state,
-                money_to_string(self.monthly_price),
-                money_to_string(self.monthly_server_price),
-                money_to_string(self.monthly_storage_price),
-                self.region_name,
-                self.instance_type,
-                self.reason,
-                self.operating_system]
+# Creating boto3 clients from the default session isn't thread-safe, but using them once they're created is
+_boto3_lock = threading.Lock()
 
 
-# Get a list of model classes representing important properties of EC2 instances
-def list_ec2_instances():
-    ec2 = boto3.client('ec2', region_name='us-west-2')
+def make_client(service_name: str, region_name: str):
+    with _boto3_lock:
+        return boto3.client(service_name, region_name=region_name)
 
-    describe_regions_response = ec2.describe_regions()
+
+def make_resource(service_name: str, region_name: str):
+    with _boto3_lock:
+        return boto3.resource(service_name, region_name=region_name)
+
+
+# Get a list of model classes representing important properties of EC2 instances
+def list_ec2_instances(region_names: list = None):
+    if region_names is None:
+        print('Checking all AWS regions...')
+        region_names = list_region_names()
     instances = []
     i = 1
-    print('Checking all AWS regions...')
-    for region in describe_regions_response['Regions']:
-        print('region = ' + str(region))
-        region_name = region['RegionName']
-        ec2 = boto3.client('ec2', region_name=region_name)
+    for region_name in region_names:
+        print('region = ' + region_name)
+        ec2 = make_client('ec2', region_name=region_name)
         describe_instances_response = ec2.describe_instances()
         for reservation in describe_instances_response['Reservations']:
             for instance_dict in reservation['Instances']:
@@ -91,6 +44,13 @@ def list_ec2_instances():
     return instances
 
 
+# Get the names of all AWS regions available to this account
+def list_region_names() -> list:
+    ec2 = make_client('ec2', region_name='us-west-2')
+    describe_regions_response = ec2.describe_regions()
+    return [region['RegionName'] for region in describe_regions_response['Regions']]
+
+
 # Get the info about a single EC2 instance
 def build_instance_model(region_name: str, instance_dict: dict) -> Instance:
     tags = make_tags_dict(instance_dict.get('Tags', []))
@@ -99,33 +59,75 @@ def build_instance_model(region_name: str, instance_dict: dict) -> Instance:
     state = instance_dict['State']['Name']
     state_reason = instance_dict.get('StateTransitionReason', '')
     instance_type = instance_dict['InstanceType']
-    name = tags.get('Name', '')
     platform = instance_dict.get('Platform', '')
     operating_system = ('Windows' if platform == 'windows' else 'Linux')
 
     monthly_server_price = lookup_monthly_price(region_name, instance_type, operating_system)
     monthly_storage_price = estimate_monthly_ebs_storage_price(region_name, instance_dict['InstanceId'])
-    monthly_price = (monthly_server_price + monthly_storage_price) if state == 'running' else monthly_storage_price
-
-    stop_after = tags.get('Stop after', tags.get('Stop After', tags.get('StopAfter', '')))
-    terminate_after = tags.get('Terminate after', tags.get('Terminate After', tags.get('TerminateAfter', '')))
-    contact = tags.get('Contact', '')
-    nagbot_state = tags.get('Nagbot State', '')
+    monthly_price = compute_monthly_price(state, monthly_server_price, monthly_storage_price)
 
     return Instance(region_name=region_name,
                     instance_id=instance_id,
                     state=state,
                     reason=state_reason,
                     instance_type=instance_type,
-                    name=name,
                     operating_system=operating_system,
                     monthly_price=monthly_price,
                     monthly_server_price=monthly_server_price,
                     monthly_storage_price=monthly_storage_price,
-                    stop_after=stop_after,
-                    terminate_after=terminate_after,
-                    contact=contact,
-                    nagbot_state=nagbot_state);
+                    **get_tag_fields(tags));
+
+
+# Get the Instance fields which come from tags. Some tags have been spelled a few different ways over time.
+def get_tag_fields(tags: dict) -> dict:
+    return {'name': tags.get('Name', ''),
+            'stop_after': tags.get('Stop after', tags.get('Stop After', tags.get('StopAfter', ''))),
+            'terminate_after': tags.get('Terminate after', tags.get('Terminate After', tags.get('TerminateAfter', ''))),
+            'contact': tags.get('Contact', ''),
+            'nagbot_state': tags.get('Nagbot State', '')}
+
+
+# Stopped instances only cost money for their storage
+def compute_monthly_price(state: str, monthly_server_price: float, monthly_storage_price: float) -> float:
+    return (monthly_server_price + monthly_storage_price) if state == 'running' else monthly_storage_price
+
+
+# Get a single EC2 instance, or None if it doesn't exist
+def get_ec2_instance(region_name: str, instance_id: str) -> Instance:
+    ec2 = make_client('ec2', region_name=region_name)
+    try:
+        describe_instances_response = ec2.describe_instances(InstanceIds=[instance_id])
+    except Exception as e:
+        print(f'Failure when calling describe_instances for {instance_id}: {str(e)}')
+        return None
+    for reservation in describe_instances_response['Reservations']:
+        for instance_dict in reservation['Instances']:
+            return build_instance_model(region_name, instance_dict)
+    return None
+
+
+# Get the current state of many instances in one region, with as few describe_instances calls as possible.
+# Instances which no longer exist are left out. They're looked up with an instance-id filter rather than InstanceIds,
+# because a single unknown ID in InstanceIds fails the whole call.
+def describe_instance_states(region_name: str, instance_ids: list) -> dict:
+    ec2 = make_client('ec2', region_name=region_name)
+    states = dict()
+    for start in range(0, len(instance_ids), DESCRIBE_INSTANCES_BATCH_SIZE):
+        batch = instance_ids[start:start + DESCRIBE_INSTANCES_BATCH_SIZE]
+        kwargs = {'Filters': [{'Name': 'instance-id', 'Values': batch}]}
+        while True:
+            try:
+                describe_instances_response = ec2.describe_instances(**kwargs)
+            except Exception as e:
+                print(f'Failure when calling describe_instances in region {region_name}: {str(e)}')
+                break
+            for reservation in describe_instances_response['Reservations']:
+                for instance_dict in reservation['Instances']:
+                    states[instance_dict['InstanceId']] = instance_dict['State']['Name']
+            if 'NextToken' not in describe_instances_response:
+                break
+            kwargs['NextToken'] = describe_instances_response['NextToken']
+    return states
 
 
 # Convert the tags list returned from the EC2 API to a dictionary from tag name to tag value
@@ -136,23 +138,65 @@ def make_tags_dict(tags_list: list) -> dict:
     return tags
 
 
-# Use the AWS API to look up the monthly price of an instance, assuming used all month, as hourly, on-demand
+# Look up the monthly price of an instance, assuming used all month, as hourly, on-demand.
+# Prices come from the local price catalog if there is one, and otherwise from the AWS API.
 def lookup_monthly_price(region_name: str, instance_type: str, operating_system: str) -> float:
-    ec2_offer = awspricing.offer('AmazonEC2')
-    hourly = ec2_offer.ondemand_hourly(instance_type, region=region_name, operating_system=operating_system)
+    catalog = pricing.get_catalog(list_region_names)
+    hourly = None
+    if catalog is not None:
+        hourly = catalog.lookup_hourly(region_name, instance_type, operating_system)
+    if hourly is None:
+        ec2_offer = get_ec2_offer()
+        hourly = ec2_offer.ondemand_hourly(instance_type, region=region_name, operating_system=operating_system)
     return hourly * HOURS_IN_A_MONTH
 
 
+# Load the EC2 price list. awspricing is imported on first use, because importing it is slow and it is only needed
+# when the price catalog is missing.
+def get_ec2_offer():
+    os.environ['AWSPRICING_USE_CACHE'] = '1'
+    import awspricing
+    return awspricing.offer('AmazonEC2')
+
+
 # Estimate the monthly cost of an instance's EBS storage (disk drives)
 def estimate_monthly_ebs_storage_price(region_name: str, instance_id: str) -> float:
-    ec2_resource = boto3.resource('ec2', region_name=region_name)
+    ec2_resource = make_resource('ec2', region_name=region_name)
     total_gb = sum([v.size for v in ec2_resource.Instance(instance_id).volumes.all()])
     return total_gb * 0.1 # Assume EBS costs $0.1/GB/month, true as of June 2019 for gp2 type storage
 
 
+# Receive a batch of messages from an SQS queue, as a list of (receipt handle, message body) tuples
+def receive_queue_messages(queue_url: str, visibility_timeout: int) -> list:
+    sqs = make_client('sqs', region_name=region_from_queue_url(queue_url))
+    response = sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10, WaitTimeSeconds=1,
+                                   VisibilityTimeout=visibility_timeout)
+    return [(m['ReceiptHandle'], m['Body']) for m in response.get('Messages', [])]
+
+
+# Delete messages from an SQS queue once they have been processed. Returns the receipt handles which couldn't be
+# deleted; those messages will be received again.
+def delete_queue_messages(queue_url: str, receipt_handles: list) -> list:
+    sqs = make_client('sqs', region_name=region_from_queue_url(queue_url))
+    failed_handles = []
+    for start in range(0, len(receipt_handles), 10):  # SQS deletes at most 10 messages per call
+        batch = receipt_handles[start:start + 10]
+        entries = [{'Id': str(n), 'ReceiptHandle': handle} for n, handle in enumerate(batch)]
+        response = sqs.delete_message_batch(QueueUrl=queue_url, Entries=entries)
+        for failure in response.get('Failed', []):
+            print('Failed to delete message from {}: {}'.format(queue_url, failure.get('Message', failure['Code'])))
+            failed_handles.append(batch[int(failure['Id'])])
+    return failed_handles
+
+
+# Queue URLs look like: https://sqs.us-east-1.amazonaws.com/123456789012/nagbot-events
+def region_from_queue_url(queue_url: str) -> str:
+    return queue_url.split('//', 1)[1].split('.')[1]
+
+
 # Set a tag on an instance
 def set_tag(region_name: str, instance_id: str, tag_name: str, tag_value: str) -> None:
-    ec2 = boto3.client('ec2', region_name=region_name)
+    ec2 = make_client('ec2', region_name=region_name)
     print(f'Setting tag {tag_value} on instance: {instance_id} in region {region_name}')
     response = ec2.create_tags(Resources=[instance_id], Tags=[{
         'Key': tag_name,
@@ -164,7 +208,7 @@ def set_tag(region_name: str, instance_id: str, tag_name: str, tag_value: str) -
 # Stop an EC2 instance
 def stop_instance(region_name: str, instance_id: str) -> bool:
     print(f'Stopping instance: {str(instance_id)}...')
-    ec2 = boto3.client('ec2', region_name=region_name)
+    ec2 = make_client('ec2', region_name=region_name)
     try:
         response = ec2.stop_instances(InstanceIds=[instance_id])
         print(f'Response from stop_instances: {str(response)}')
@@ -177,7 +221,7 @@ def stop_instance(region_name: str, instance_id: str) -> bool:
 # Terminate an EC2 instance
 def terminate_instance(region_name: str, instance_id: str) -> bool:
     print(f'Terminating instance: {str(instance_id)}...')
-    ec2 = boto3.client('ec2', region_name=region_name)
+    ec2 = make_client('ec2', region_name=region_name)
     try:
         response = ec2.terminate_instances(InstanceIds=[instance_id])
         print(f'Response from terminate_instances: {str(response)}')
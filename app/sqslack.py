@@ -2,12 +2,60 @@ import os
 
 import slack
 
+# Slack truncates very long messages, and long messages are hard to read anyway. Longer messages are split into
+# chunks of at most this many characters.
+MAX_MESSAGE_LENGTH = 3000
 
-def send_message(channel, message):
+
+def send_message(channel, message, thread_ts=None):
     """ Send a message to a Slack channel
+    :param thread_ts: If given, the timestamp of a message to reply to, in its thread
+    :return: The timestamp of the new message, which identifies it in the channel
     """
     slack_client = get_client()
-    slack_client.chat_postMessage(channel=channel, text=message, as_user=True)
+    if thread_ts is None:
+        response = slack_client.chat_postMessage(channel=channel, text=message, as_user=True)
+    else:
+        response = slack_client.chat_postMessage(channel=channel, text=message, as_user=True, thread_ts=thread_ts)
+    return response['ts']
+
+
+def send_lines(channel, lines):
+    """ Send a list of lines to a Slack channel. If they don't fit in a single message, the first chunk is posted
+        to the channel and the rest are posted as replies in its thread.
+    :param lines: The lines of the message, without trailing newlines
+    """
+    chunks = split_lines(lines, MAX_MESSAGE_LENGTH)
+    thread_ts = send_message(channel, chunks[0])
+    for chunk in chunks[1:]:
+        send_message(channel, chunk, thread_ts=thread_ts)
+
+
+def split_lines(lines, max_length):
+    """ Join lines into as few chunks as possible, breaking only at line boundaries.
+        A single line that is longer than max_length is broken up on its own.
+    :return: A non-empty list of strings, each at most max_length characters long
+    """
+    chunks = []
+    chunk = []
+    chunk_length = 0
+    for line in lines:
+        if len(line) > max_length:
+            if chunk:
+                chunks.append('\n'.join(chunk))
+                chunk, chunk_length = [], 0
+            while len(line) > max_length:
+                chunks.append(line[:max_length])
+                line = line[max_length:]
+        # +1 for the newline that will join this line to the previous one
+        if chunk and chunk_length + 1 + len(line) > max_length:
+            chunks.append('\n'.join(chunk))
+            chunk, chunk_length = [], 0
+        chunk_length += len(line) + (1 if chunk else 0)
+        chunk.append(line)
+    if chunk or not chunks:
+        chunks.append('\n'.join(chunk))
+    return chunks
 
 
 def lookup_user_by_email(email):
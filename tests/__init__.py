@@ -0,0 +1,21 @@
+from app.model import Instance
+
+
+# Make an Instance for a test, with sensible defaults for every field that the test doesn't care about
+def make_instance(**overrides) -> Instance:
+    fields = dict(region_name='us-east-1',
+                  instance_id='i-1',
+                  state='running',
+                  reason='',
+                  instance_type='m4.xlarge',
+                  name='Stephen',
+                  operating_system='Linux',
+                  stop_after='',
+                  terminate_after='',
+                  contact='stephen',
+                  nagbot_state='',
+                  monthly_price=1.0,
+                  monthly_server_price=1.0,
+                  monthly_storage_price=0.0)
+    fields.update(overrides)
+    return Instance(**fields)
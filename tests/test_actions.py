@@ -0,0 +1,53 @@
+import unittest
+from unittest.mock import patch
+
+from app import actions
+from tests import make_instance
+
+
+class TestActions(unittest.TestCase):
+    @patch('app.actions.sqaws.describe_instance_states')
+    @patch('app.actions.sqaws.terminate_instance')
+    @patch('app.actions.sqaws.stop_instance')
+    def test_run_actions(self, mock_stop_instance, mock_terminate_instance, mock_describe_instance_states):
+        east = make_instance(region_name='us-east-1', instance_id='i-east')
+        west = make_instance(region_name='us-west-2', instance_id='i-west')
+        broken = make_instance(region_name='us-west-2', instance_id='i-broken')
+        mock_stop_instance.side_effect = lambda region_name, instance_id: instance_id != 'i-broken'
+        mock_terminate_instance.return_value = True
+
+        # The stopped instance gets there on the second poll, the terminated one on the first
+        polls = {'us-east-1': iter([{'i-east': 'stopping'}, {'i-east': 'stopped'}]),
+                 'us-west-2': iter([{'i-west': 'shutting-down'}, {'i-west': 'terminated'}])}
+        mock_describe_instance_states.side_effect = lambda region_name, instance_ids: next(polls[region_name])
+
+        results = actions.run_actions([(east, actions.STOP), (west, actions.TERMINATE), (broken, actions.STOP)],
+                                      poll_interval_seconds=0)
+
+        assert [r.instance for r in results] == [east, west, broken]
+        assert [r.final_state for r in results] == ['stopped', 'terminated', None]
+        assert [r.succeeded for r in results] == [True, True, False]
+        assert results[2].describe() == 'request failed'
+
+        # One batched call per region per poll, never for instances whose request failed
+        assert mock_describe_instance_states.call_count == 4
+        for call in mock_describe_instance_states.call_args_list:
+            assert 'i-broken' not in call[0][1]
+
+
+    @patch('app.actions.sqaws.describe_instance_states')
+    @patch('app.actions.sqaws.stop_instance')
+    def test_run_actions_deadline(self, mock_stop_instance, mock_describe_instance_states):
+        instance = make_instance(region_name='us-east-1', instance_id='i-slow')
+        mock_stop_instance.return_value = True
+        mock_describe_instance_states.return_value = {'i-slow': 'stopping'}
+
+        results = actions.run_actions([(instance, actions.STOP)], deadline_seconds=0, poll_interval_seconds=1)
+
+        assert not results[0].succeeded
+        assert results[0].describe() == 'still stopping at the deadline'
+        assert mock_describe_instance_states.call_count == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
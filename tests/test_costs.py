@@ -0,0 +1,42 @@
+import unittest
+
+from app import costs
+from tests import make_instance
+
+
+class TestCosts(unittest.TestCase):
+    def test_aggregate_costs(self):
+        instances = [make_instance(instance_id='i-1', state='running', contact='alice', monthly_price=100.0),
+                     make_instance(instance_id='i-2', state='running', contact='bob', monthly_price=50.0,
+                                   region_name='us-west-2'),
+                     make_instance(instance_id='i-3', state='stopped', contact='bob', monthly_price=5.0),
+                     make_instance(instance_id='i-4', state='running', contact='carol', monthly_price=70.0),
+                     make_instance(instance_id='i-5', state='stopped', contact='', monthly_price=1.0)]
+
+        report = costs.aggregate_costs(instances, top_n=2)
+
+        assert report.total == costs.CostGroup(5, 226.0)
+        assert report.state('running') == costs.CostGroup(3, 220.0)
+        assert report.state('stopped') == costs.CostGroup(2, 6.0)
+        assert report.state('terminated') == costs.CostGroup(0, 0.0)
+
+        assert report.groups['contact']['bob'] == costs.CostGroup(2, 55.0)
+        assert report.groups['region_name'] == {'us-east-1': costs.CostGroup(4, 176.0),
+                                                'us-west-2': costs.CostGroup(1, 50.0)}
+        assert report.groups['instance_type'] == {'m4.xlarge': costs.CostGroup(5, 226.0)}
+
+        assert [i.instance_id for i in report.top_instances] == ['i-1', 'i-4']
+        assert report.top_contacts == [('alice', costs.CostGroup(1, 100.0)), ('carol', costs.CostGroup(1, 70.0))]
+
+
+    def test_aggregate_costs_empty(self):
+        report = costs.aggregate_costs([])
+
+        assert report.total == costs.CostGroup(0, 0.0)
+        assert report.top_instances == []
+        assert report.top_contacts == []
+        assert report.to_rows()[1] == ['Total', '', 0, '$0.00']
+
+
+if __name__ == '__main__':
+    unittest.main()
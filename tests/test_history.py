@@ -0,0 +1,52 @@
+import unittest
+
+from app import history
+from tests import make_instance
+
+
+class TestHistory(unittest.TestCase):
+    def test_write_and_read_snapshot(self):
+        conn = history.connect(':memory:')
+        instances = [make_instance(instance_id='i-1', state='running', contact='alice', monthly_price=10.0),
+                     make_instance(instance_id='i-2', state='stopped', contact='bob', monthly_price=1.5)]
+
+        history.write_snapshot(conn, '2019-06-01', instances)
+        assert history.read_snapshot(conn, '2019-06-01') == instances
+
+        # Writing the same date again replaces the old snapshot
+        history.write_snapshot(conn, '2019-06-01', instances[:1])
+        assert history.read_snapshot(conn, '2019-06-01') == instances[:1]
+
+
+    def test_cost_trend(self):
+        conn = history.connect(':memory:')
+        history.write_snapshot(conn, '2019-06-01',
+                               [make_instance(instance_id='i-1', state='running', contact='alice', monthly_price=10.0),
+                                make_instance(instance_id='i-2', state='running', contact='alice', monthly_price=5.0),
+                                make_instance(instance_id='i-3', state='running', contact='bob', monthly_price=1.0)])
+        history.write_snapshot(conn, '2019-06-02',
+                               [make_instance(instance_id='i-1', state='stopped', contact='alice', monthly_price=1.0)])
+
+        assert history.cost_trend(conn, '2019-06-01') == [('2019-06-01', 'alice', 15.0, 2),
+                                                          ('2019-06-01', 'bob', 1.0, 1),
+                                                          ('2019-06-02', 'alice', 1.0, 1)]
+        assert history.cost_trend(conn, '2019-06-02', contact='alice') == [('2019-06-02', 'alice', 1.0, 1)]
+
+
+    def test_time_to_stop_days(self):
+        conn = history.connect(':memory:')
+        history.write_snapshot(conn, '2019-06-01',
+                               [make_instance(instance_id='i-1', state='running', contact='alice', monthly_price=10.0),
+                                make_instance(instance_id='i-2', state='running', contact='bob', monthly_price=10.0)])
+        history.write_snapshot(conn, '2019-06-03',
+                               [make_instance(instance_id='i-1', state='stopped', contact='alice', monthly_price=1.0),
+                                make_instance(instance_id='i-2', state='running', contact='bob', monthly_price=10.0)])
+        history.write_snapshot(conn, '2019-06-08',
+                               [make_instance(instance_id='i-1', state='stopped', contact='alice', monthly_price=1.0),
+                                make_instance(instance_id='i-2', state='stopped', contact='bob', monthly_price=1.0)])
+
+        assert sorted(history.time_to_stop_days(conn)) == [2, 7]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from app import inventory
+from tests import make_instance
+
+
+class TestInventory(unittest.TestCase):
+    def setup_instance(self, instance_id: str, state: str):
+        return make_instance(instance_id=instance_id, state=state, reason='User initiated', stop_after='2019-01-01',
+                             monthly_price=12.0 if state == 'running' else 2.0, monthly_server_price=10.0,
+                             monthly_storage_price=2.0)
+
+
+    def state_change_event(self, instance_id: str, state: str):
+        return {'detail-type': 'EC2 Instance State-change Notification',
+                'region': 'us-east-1',
+                'detail': {'instance-id': instance_id, 'state': state}}
+
+
+    def tag_change_event(self, instance_id: str, tags: dict):
+        return {'detail-type': 'Tag Change on Resource',
+                'region': 'us-east-1',
+                'resources': ['arn:aws:ec2:us-east-1:123456789012:instance/' + instance_id],
+                'detail': {'service': 'ec2', 'resource-type': 'instance', 'tags': tags}}
+
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.snapshot_path = os.path.join(self.temp_dir.name, 'inventory.jsonl')
+        self.events_path = os.path.join(self.temp_dir.name, 'events.jsonl')
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def append_events(self, events):
+        with open(self.events_path, 'a') as f:
+            for event in events:
+                f.write(json.dumps(event) + '\n')
+
+
+    def test_save_and_load_instances(self):
+        instances = [self.setup_instance('i-1', 'running'), self.setup_instance('i-2', 'stopped')]
+
+        inventory.save_instances(self.snapshot_path, instances)
+
+        assert inventory.load_instances(self.snapshot_path) == instances
+
+
+    def test_apply_state_change(self):
+        instances = {'i-1': self.setup_instance('i-1', 'running')}
+
+        inventory.apply_event(instances, self.state_change_event('i-1', 'stopped'))
+
+        assert instances['i-1'].state == 'stopped'
+        assert instances['i-1'].reason == ''
+        assert instances['i-1'].monthly_price == 2.0
+
+
+    def test_apply_tag_change(self):
+        instances = {'i-1': self.setup_instance('i-1', 'running')}
+
+        inventory.apply_event(instances, self.tag_change_event('i-1', {'Name': 'Stephen',
+                                                                       'Stop After': '2020-01-01',
+                                                                       'Contact': 'someone.else'}))
+
+        assert instances['i-1'].stop_after == '2020-01-01'
+        assert instances['i-1'].contact == 'someone.else'
+        assert instances['i-1'].terminate_after == ''
+
+
+    @patch('app.sqaws.get_ec2_instance')
+    def test_apply_event_for_new_instance(self, mock_get_ec2_instance):
+        new_instance = self.setup_instance('i-2', 'pending')
+        mock_get_ec2_instance.return_value = new_instance
+        instances = {}
+
+        inventory.apply_event(instances, self.state_change_event('i-2', 'pending'))
+        inventory.apply_event(instances, self.state_change_event('i-3', 'terminated'))
+
+        assert instances == {'i-2': new_instance}
+        mock_get_ec2_instance.assert_called_once_with('us-east-1', 'i-2')
+
+
+    def test_apply_events_out_of_order(self):
+        instances = {'i-1': self.setup_instance('i-1', 'stopped')}
+        event_times = dict()
+        running = dict(self.state_change_event('i-1', 'running'), time='2019-06-01T12:05:00Z')
+        stopped = dict(self.state_change_event('i-1', 'stopped'), time='2019-06-01T12:00:00Z')
+        tagged = dict(self.tag_change_event('i-1', {'Name': 'Renamed'}), time='2019-06-01T11:00:00Z')
+
+        for event in [running, stopped, tagged]:
+            inventory.apply_event(instances, event, event_times)
+
+        # The late "stopped" event is older than "running", so it's dropped. Tags are tracked separately.
+        assert instances['i-1'].state == 'running'
+        assert instances['i-1'].name == 'Renamed'
+        assert event_times == {'i-1/state': '2019-06-01T12:05:00', 'i-1/tags': '2019-06-01T11:00:00'}
+
+
+    def test_read_event_log(self):
+        self.append_events([self.state_change_event('i-1', 'stopped')])
+        with open(self.events_path, 'a') as f:
+            f.write('{"partially written')
+
+        events, offset = inventory.read_event_log(self.events_path, 0)
+        assert events == [self.state_change_event('i-1', 'stopped')]
+
+        events, offset = inventory.read_event_log(self.events_path, offset)
+        assert events == []
+
+
+    @patch('app.sqaws.receive_queue_messages')
+    def test_receive_queue_events(self, mock_receive_queue_messages):
+        queue_url = 'https://sqs.us-east-1.amazonaws.com/123456789012/nagbot-events'
+        body = json.dumps(self.state_change_event('i-1', 'stopped'))
+
+        # A queue which never runs dry is only read up to the limit
+        mock_receive_queue_messages.return_value = [('handle', body)] * 10
+        events, receipt_handles = inventory.receive_queue_events(queue_url, max_events=25)
+        assert len(events) == 30
+        assert len(receipt_handles) == 30
+        mock_receive_queue_messages.assert_called_with(queue_url, inventory.QUEUE_VISIBILITY_TIMEOUT_SECONDS)
+
+        # Or until the time budget runs out
+        times = iter([0, 10, 20, 70])
+        mock_receive_queue_messages.reset_mock()
+        events, _ = inventory.receive_queue_events(queue_url, time_budget_seconds=60, clock=lambda: next(times))
+        assert len(events) == 20
+        assert mock_receive_queue_messages.call_count == 2
+
+        # Or until it's empty
+        mock_receive_queue_messages.side_effect = [[('handle', body)], []]
+        events, _ = inventory.receive_queue_events(queue_url)
+        assert len(events) == 1
+
+
+    @patch('app.sqaws.list_ec2_instances')
+    def test_update_inventory(self, mock_list_ec2_instances):
+        mock_list_ec2_instances.return_value = [self.setup_instance('i-1', 'running'),
+                                                self.setup_instance('i-2', 'running')]
+        self.append_events([self.state_change_event('i-1', 'stopping')])
+        now = datetime(2019, 6, 1, 12, 0, 0)
+
+        # The first run has to do a full scan. Events from before the scan are already included in it.
+        instances = inventory.update_inventory(self.snapshot_path, self.events_path, now=now)
+        assert [i.state for i in instances] == ['running', 'running']
+        assert mock_list_ec2_instances.call_count == 1
+
+        # Later runs only apply new events
+        self.append_events([self.state_change_event('i-2', 'stopped')])
+        instances = inventory.update_inventory(self.snapshot_path, self.events_path, now=datetime(2019, 6, 1, 13))
+        assert [i.state for i in instances] == ['running', 'stopped']
+        assert inventory.load_instances(self.snapshot_path) == instances
+        assert mock_list_ec2_instances.call_count == 1
+
+        # Once the snapshot is old enough, do another full scan
+        inventory.update_inventory(self.snapshot_path, self.events_path, now=datetime(2019, 6, 2, 12))
+        assert mock_list_ec2_instances.call_count == 2
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 import sys
+import threading
 import unittest
+from unittest.mock import patch
 
 import app
 from app import nagbot
@@ -72,7 +74,7 @@ class TestNagbot(unittest.TestCase):
         today_date_warned = self.setup_instance(state='stopped', terminate_after=nagbot.TODAY_YYYY_MM_DD + today_warning_str)
         anything_warned = self.setup_instance(state='stopped', terminate_after='Yummy Udon Noodles' + today_warning_str)
 
-        old_warning_str = ' (Nagbot: Warned on ' + nagbot.MIN_TERMINATION_WARNING_YYYY_MM_DD + ')'
+        old_warning_str = ' (Nagbot: Warned on ' + nagbot.get_min_termination_warning(nagbot.TODAY_YYYY_MM_DD) + ')'
         past_date_warned_days_ago = self.setup_instance(state='stopped', terminate_after='2019-01-01' + old_warning_str)
         anything_warned_days_ago = self.setup_instance(state='stopped', terminate_after='Yummy Udon Noodles' + old_warning_str)
 
@@ -112,6 +114,92 @@ class TestNagbot(unittest.TestCase):
 
 
 
+    def test_hour_precision(self):
+        stop_at_five = self.setup_instance(state='running',
+                                           stop_after='2019-06-03 17:00 (Nagbot: Warned on 2019-06-03)')
+
+        assert not nagbot.is_safe_to_stop(stop_at_five, '2019-06-03 16:59')
+        assert nagbot.is_safe_to_stop(stop_at_five, '2019-06-03 17:00')
+        # Given just the date, as 'notify' is, it's due on the day
+        assert nagbot.is_stoppable(stop_at_five, '2019-06-03')
+        assert not nagbot.is_stoppable(stop_at_five, '2019-06-02')
+        # A date alone expires at the start of the day
+        date_only = self.setup_instance(state='running', stop_after='2019-06-03 (Nagbot: Warned on 2019-06-01)')
+        assert nagbot.is_safe_to_stop(date_only, '2019-06-03 00:00')
+        assert not nagbot.is_safe_to_stop(date_only, '2019-06-02 23:59')
+
+        # Saturday, warned Thursday afternoon, so three days haven't passed yet until Sunday afternoon
+        terminate = self.setup_instance(state='stopped', terminate_after='2019-06-01 (Nagbot: Warned on 2019-06-06)')
+        assert not nagbot.is_safe_to_terminate(terminate, '2019-06-08 12:00')
+        assert nagbot.is_safe_to_terminate(terminate, '2019-06-09 00:00')
+
+        assert nagbot.is_weekend('2019-06-08 12:00')  # Saturday
+        assert not nagbot.is_weekend('2019-06-10 12:00')  # Monday
+
+
+    @patch('app.sqslack.send_lines')
+    @patch('app.sqslack.send_message')
+    @patch('app.nagbot.warn_stoppable_instances')
+    @patch('app.nagbot.warn_terminatable_instances')
+    @patch('app.nagbot.write_history')
+    @patch('app.nagbot.write_spreadsheet')
+    def test_notify_pipeline(self, mock_write_spreadsheet, mock_write_history, mock_warn_terminatable,
+                             mock_warn_stoppable, mock_send_message, mock_send_lines):
+        # Each branch waits for all four to be running. If they ran one at a time, the first would time out.
+        barrier = threading.Barrier(4, timeout=10)
+        def together(result):
+            def run(*args):
+                barrier.wait()
+                return result
+            return run
+
+        mock_write_spreadsheet.side_effect = together('https://example.com/sheet')
+        mock_write_history.side_effect = together(None)
+        mock_warn_terminatable.side_effect = together(['terminate'])
+        mock_warn_stoppable.side_effect = together(['stop'])
+        bot = nagbot.Nagbot()
+        bot.list_instances = lambda: [self.setup_instance(state='running', stop_after='2019-01-01')]
+
+        bot.notify_internal('#nagbot')
+
+        assert 'https://example.com/sheet' in mock_send_message.call_args[0][1]
+        assert [c[0][1] for c in mock_send_lines.call_args_list] == [['terminate'], ['stop']]
+        assert mock_warn_stoppable.call_args[0][0][0].stop_after == '2019-01-01'
+
+
+    @patch('app.sqslack.send_lines')
+    @patch('app.sqslack.send_message')
+    @patch('app.nagbot.warn_stoppable_instances')
+    @patch('app.nagbot.warn_terminatable_instances')
+    @patch('app.nagbot.write_history')
+    @patch('app.nagbot.write_spreadsheet')
+    def test_notify_pipeline_failure(self, mock_write_spreadsheet, mock_write_history, mock_warn_terminatable,
+                                     mock_warn_stoppable, mock_send_message, mock_send_lines):
+        mock_write_spreadsheet.return_value = None
+        mock_warn_terminatable.side_effect = Exception('set_tag failed')
+        mock_warn_stoppable.return_value = ['stop']
+        bot = nagbot.Nagbot()
+        bot.list_instances = lambda: [self.setup_instance(state='running', stop_after='2019-01-01')]
+
+        with self.assertRaises(Exception) as context:
+            bot.notify_internal('#nagbot')
+
+        # The stop warnings were tagged, so they must still be posted even though the terminate branch failed
+        assert str(context.exception) == 'set_tag failed'
+        mock_send_message.assert_called_once()
+        assert [c[0][1] for c in mock_send_lines.call_args_list] == [['stop']]
+
+
+
+    @patch('app.sqaws.describe_instance_states')
+    def test_confirm_states(self, mock_describe_instance_states):
+        mock_describe_instance_states.return_value = {'abc123': 'running'}
+        stale = self.setup_instance(state='stopped', terminate_after='2019-01-01')
+
+        # The snapshot said it was stopped, but it has been started since
+        assert nagbot.confirm_states([stale], 'stopped') == []
+        assert nagbot.confirm_states([stale], 'running') == [stale]
+        mock_describe_instance_states.assert_called_with('us-east-1', ['abc123'])
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -36,6 +36,13 @@ class TestParsing(unittest.TestCase):
         assert not is_date(123)
 
 
+    def test_parse_date_time(self):
+        assert parsing.parse_date_time('2019-12-31') == datetime(2019, 12, 31)
+        assert parsing.parse_date_time('2019-12-31 17:05') == datetime(2019, 12, 31, 17, 5)
+        assert parsing.parse_date_time('2019-12-31 25:00') is None
+        assert parsing.parse_date_time('TBD') is None
+
+
     def test_date_to_string(self):
         def roundtrip(str):
             datetime = parsing.parse_date(str)
@@ -60,6 +67,24 @@ class TestParsing(unittest.TestCase):
         assert parsed.on_weekends == False
         assert parsed.warning_date == '2019-02-01'
 
+        parsed = parsing.parse_date_tag('2019-01-01 17:30 (Nagbot: Warned on 2019-02-01)')
+        assert parsed.expiry_date == '2019-01-01 17:30'
+        assert parsed.on_weekends == False
+        assert parsed.warning_date == '2019-02-01'
+
+        parsed = parsing.parse_date_tag('2019-01-01T9:00')
+        assert parsed.expiry_date == '2019-01-01 09:00'
+
+        # Invalid times are ignored, rather than failing the whole run
+        assert parsing.parse_date_tag('2019-01-01 25:00').expiry_date == '2019-01-01'
+        assert parsing.parse_date_tag('2019-01-01 9:75').expiry_date == '2019-01-01'
+        assert parsing.parse_date_tag('2019-01-01 17:300').expiry_date == '2019-01-01'
+        assert parsing.parse_date_tag('2019-01-01 23:59').expiry_date == '2019-01-01 23:59'
+
+        # Zone suffixes are ignored, so the time is taken as local time
+        assert parsing.parse_date_tag('2019-01-01T17:00Z').expiry_date == '2019-01-01 17:00'
+        assert parsing.parse_date_tag('2019-01-01 17:00+02:00').expiry_date == '2019-01-01 17:00'
+
         parsed = parsing.parse_date_tag('On Weekends')
         assert parsed.expiry_date == None
         assert parsed.on_weekends == True
@@ -95,6 +120,9 @@ class TestParsing(unittest.TestCase):
         assert roundtrip('2019-01-01 (Nagbot: Warned on 2019-02-01)') \
                == '2019-01-01 (Nagbot: Warned on 2019-02-01)'
 
+        assert roundtrip('2019-01-01 17:30 (Nagbot: Warned on 2019-02-01)') \
+               == '2019-01-01 17:30 (Nagbot: Warned on 2019-02-01)'
+
         assert roundtrip('On Weekends') == 'On Weekends'
         assert roundtrip('oN wEeKeNdS') == 'On Weekends'
         assert roundtrip('On Weekends (Nagbot: Warned on 2019-02-01)') \
@@ -0,0 +1,161 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from app import pricing
+
+HEADER = ['SKU', 'OfferTermCode', 'TermType', 'Unit', 'PricePerUnit', 'Currency', 'Region Code', 'Instance Type',
+          'Operating System', 'Tenancy', 'Pre Installed S/W', 'License Model', 'CapacityStatus']
+
+
+def make_row(region_code='us-east-1', instance_type='m4.xlarge', operating_system='Linux', price='0.2',
+             term_type='OnDemand', tenancy='Shared', license_model='No License required', capacity_status='Used'):
+    return ['ABC123', 'JRTCKXETXF', term_type, 'Hrs', price, 'USD', region_code, instance_type, operating_system,
+            tenancy, 'NA', license_model, capacity_status]
+
+
+def make_csv(rows):
+    lines = ['"FormatVersion","v1.0"', '"OfferCode","AmazonEC2"', ','.join('"%s"' % h for h in HEADER)]
+    lines += [','.join('"%s"' % value for value in row) for row in rows]
+    return io.StringIO('\n'.join(lines) + '\n')
+
+
+class TestPricing(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.catalog_path = os.path.join(self.temp_dir.name, 'prices.bin')
+        self.environ = patch.dict(os.environ, {'NAGBOT_PRICE_CATALOG': self.catalog_path})
+        self.environ.start()
+        pricing._catalog = None
+        pricing._catalog_unavailable = False
+        pricing._refresh_process = None
+
+
+    def tearDown(self):
+        if pricing._catalog is not None:
+            pricing._catalog.mmap.close()
+        pricing._catalog = None
+        pricing._catalog_unavailable = False
+        pricing._refresh_process = None
+        self.environ.stop()
+        self.temp_dir.cleanup()
+
+
+    def test_parse_offer_csv(self):
+        offer_csv = make_csv([make_row(),
+                              make_row(operating_system='Windows', price='0.4'),
+                              make_row(region_code='eu-west-1', price='0.25'),
+                              make_row(operating_system='RHEL', price='0.3'),
+                              make_row(term_type='Reserved', price='0.1'),
+                              make_row(tenancy='Dedicated', price='0.5'),
+                              make_row(license_model='Bring your own license', price='0.6'),
+                              make_row(capacity_status='UnusedCapacityReservation', price='0.7')])
+
+        prices = pricing.parse_offer_csv(offer_csv, region_names={'us-east-1'})
+
+        assert prices == {b'us-east-1|m4.xlarge|Linux': 0.2, b'us-east-1|m4.xlarge|Windows': 0.4}
+
+
+    def test_catalog_lookup(self):
+        prices = pricing.parse_offer_csv(make_csv([make_row(instance_type='t%d.large' % n, price=str(n))
+                                                   for n in range(100)]))
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'prices.bin')
+            pricing.write_catalog(path, prices)
+            catalog = pricing.PriceCatalog(path)
+
+            assert len(catalog) == 100
+            for n in range(100):
+                assert catalog.lookup_hourly('us-east-1', 't%d.large' % n, 'Linux') == n
+            assert catalog.lookup_hourly('us-east-1', 't1000.large', 'Linux') is None
+            assert catalog.lookup_hourly('us-east-1', 't1.large', 'Windows') is None
+            assert catalog.lookup_hourly('aa-east-1', 't1.large', 'Linux') is None
+            assert catalog.lookup_hourly('zz-east-1', 't1.large', 'Linux') is None
+            catalog.mmap.close()
+
+
+    def test_invalid_catalog(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'prices.bin')
+            with open(path, 'wb') as f:
+                f.write(b'not a price catalog')
+
+            with self.assertRaises(ValueError):
+                pricing.PriceCatalog(path)
+
+
+
+    @patch('app.pricing.refresh_in_background')
+    @patch('app.pricing.refresh_catalog')
+    def test_get_catalog_builds_missing_catalog(self, mock_refresh_catalog, mock_refresh_in_background):
+        mock_refresh_catalog.side_effect = lambda path, region_names: pricing.write_catalog(
+            path, pricing.parse_offer_csv(make_csv([make_row()]), region_names))
+
+        catalog = pricing.get_catalog(lambda: ['us-east-1'])
+
+        # Built right away, rather than falling back to awspricing while it downloads in the background
+        mock_refresh_catalog.assert_called_once_with(self.catalog_path, {'us-east-1'})
+        mock_refresh_in_background.assert_not_called()
+        assert catalog.lookup_hourly('us-east-1', 'm4.xlarge', 'Linux') == 0.2
+        assert os.listdir(self.temp_dir.name) == ['prices.bin']  # No temporary files left behind
+        assert pricing.get_catalog() is catalog
+
+
+    @patch('app.pricing.subprocess.Popen')
+    def test_refresh_in_background(self, mock_popen):
+        pricing.refresh_in_background(self.catalog_path, lambda: ['us-west-2', 'us-east-1'])
+
+        # A detached process, so it isn't killed when this one exits
+        mock_popen.assert_called_once()
+        command = mock_popen.call_args[0][0]
+        lock_path = pricing.get_lock_path(self.catalog_path)
+        assert command[1:] == ['-m', 'app.pricing', '--catalog', self.catalog_path, '--lock', lock_path,
+                               '--regions', 'us-east-1', 'us-west-2']
+        assert mock_popen.call_args[1]['start_new_session']
+        assert os.path.exists(lock_path)
+
+        # Another run doesn't start a second refresh while the lock is held, unless the lock is old
+        pricing._refresh_process = None
+        pricing.refresh_in_background(self.catalog_path)
+        assert mock_popen.call_count == 1
+
+        os.utime(lock_path, (0, 0))
+        pricing._refresh_process = None
+        pricing.refresh_in_background(self.catalog_path)
+        assert mock_popen.call_count == 2
+
+
+    @patch('app.pricing.subprocess.Popen')
+    def test_refresh_in_background_failure(self, mock_popen):
+        def get_region_names():
+            raise RuntimeError('Rate exceeded')
+
+        pricing.refresh_in_background(self.catalog_path, get_region_names)
+
+        mock_popen.assert_not_called()
+        assert not os.path.exists(pricing.get_lock_path(self.catalog_path))
+
+
+    @patch('app.pricing.is_worker_process', return_value=True)
+    @patch('app.pricing.refresh_catalog')
+    def test_get_catalog_in_worker(self, mock_refresh_catalog, mock_is_worker_process):
+        assert pricing.get_catalog() is None
+        mock_refresh_catalog.assert_not_called()
+
+
+    @patch('app.pricing.refresh_catalog')
+    def test_get_catalog_invalid(self, mock_refresh_catalog):
+        with open(self.catalog_path, 'wb') as f:
+            f.write(b'not a price catalog')
+
+        # Fall back to awspricing, and don't keep trying on every lookup
+        assert pricing.get_catalog() is None
+        assert pricing.get_catalog() is None
+        mock_refresh_catalog.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
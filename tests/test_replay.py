@@ -0,0 +1,113 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import boto3
+import botocore.exceptions
+from botocore.stub import Stubber
+
+import app.sqaws
+import app.sqslack
+from app import replay
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cassette_path = os.path.join(self.temp_dir.name, 'cassette.jsonl')
+        os.environ['SLACK_BOT_TOKEN'] = '<not a real Slack API token>'
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def make_ec2_client(self):
+        return boto3.client('ec2', region_name='us-east-1', aws_access_key_id='x', aws_secret_access_key='y')
+
+
+    def record_describe_instances(self):
+        launch_time = datetime(2019, 6, 1, 12, 0, 0, tzinfo=timezone.utc)
+        with replay.recording(self.cassette_path):
+            ec2 = self.make_ec2_client()
+            with Stubber(ec2) as stubber:
+                stubber.add_response('describe_instances',
+                                     {'Reservations': [{'OwnerId': '210987654321', 'Instances': [
+                                         {'InstanceId': 'i-1', 'LaunchTime': launch_time,
+                                          'Tags': [{'Key': 'Contact', 'Value': 'stephen.rosenthal@seeq.com'}]}]}]},
+                                     {'InstanceIds': ['i-1']})
+                ec2.describe_instances(InstanceIds=['i-1'])
+        return launch_time
+
+
+    def test_sanitize_string(self):
+        sanitized = replay.sanitize_string('stephen.rosenthal@seeq.com owns 210987654321 with xoxb-1234-abcd')
+
+        assert 'seeq' not in sanitized and '210987654321' not in sanitized and 'xoxb-1234' not in sanitized
+        assert replay.sanitize_string(sanitized) == sanitized
+        assert replay.sanitize_string('Stephen.Rosenthal@seeq.com') == replay.sanitize_string('stephen.rosenthal@seeq.com')
+
+        # Pseudonyms come from a secret made for each recording, so they can't be matched up by hashing known emails
+        pseudonym = replay.sanitize_string('stephen.rosenthal@seeq.com')
+        replay.new_pseudonym_key()
+        assert replay.sanitize_string('stephen.rosenthal@seeq.com') != pseudonym
+
+
+    def test_boto3_record_and_replay(self):
+        launch_time = self.record_describe_instances()
+
+        with replay.replaying(self.cassette_path):
+            response = self.make_ec2_client().describe_instances(InstanceIds=['i-1'])
+
+        reservation = response['Reservations'][0]
+        assert reservation['OwnerId'] == '123456789012'
+        assert reservation['Instances'][0]['LaunchTime'] == launch_time
+        assert reservation['Instances'][0]['Tags'][0]['Value'].endswith('@example.com')
+
+
+    def test_boto3_replay_throttling_and_latency(self):
+        self.record_describe_instances()
+
+        conditions = replay.Conditions(latency_scale=0, extra_latency=0.1, throttle_rate=1.0)
+        with replay.replaying(self.cassette_path, conditions):
+            start = time.monotonic()
+            with self.assertRaises(botocore.exceptions.ClientError) as context:
+                self.make_ec2_client().describe_instances(InstanceIds=['i-1'])
+            elapsed = time.monotonic() - start
+
+        assert context.exception.response['Error']['Code'] == 'RequestLimitExceeded'
+        assert elapsed >= 0.1
+
+
+    def test_slack_record_and_replay(self):
+        def api_call(self, api_method, **kwargs):
+            return replay.ReplayedSlackResponse({'ok': True, 'ts': '1234.5678', 'user': {'id': 'UJ0JNCX19'}})
+
+        with patch('slack.WebClient.api_call', api_call):
+            with replay.recording(self.cassette_path):
+                app.sqslack.send_message('#nagbot', 'Hello on ' + datetime.now().isoformat())
+                app.sqslack.lookup_user_by_email('stephen.rosenthal@seeq.com')
+
+        with replay.replaying(self.cassette_path):
+            # The message text is different, so this matches on just the API method
+            assert app.sqslack.send_message('#nagbot', 'Hello again') == '1234.5678'
+            assert app.sqslack.lookup_user_by_email('stephen.rosenthal@seeq.com') == '<@UJ0JNCX19>'
+
+            with self.assertRaises(replay.CassetteMiss):
+                app.sqslack.get_client().api_call('users.list')
+
+
+    def test_price_record_and_replay(self):
+        with patch('app.sqaws.lookup_monthly_price', return_value=146.0):
+            with replay.recording(self.cassette_path):
+                assert app.sqaws.lookup_monthly_price('us-east-1', 'm4.xlarge', 'Linux') == 146.0
+
+        with replay.replaying(self.cassette_path):
+            assert app.sqaws.lookup_monthly_price('us-east-1', 'm4.xlarge', 'Linux') == 146.0
+
+
+if __name__ == '__main__':
+    unittest.main()
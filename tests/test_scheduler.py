@@ -0,0 +1,136 @@
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from app import actions
+from app import nagbot
+from app import scheduler
+from tests import make_instance
+
+
+class TestScheduler(unittest.TestCase):
+    def test_deadlines(self):
+        warned_early = make_instance(instance_id='i-1', stop_after='2019-06-03 17:00 (Nagbot: Warned on 2019-06-01)')
+        warned_late = make_instance(instance_id='i-2', stop_after='2019-06-01 (Nagbot: Warned on 2019-06-02)')
+        not_warned = make_instance(instance_id='i-3', stop_after='2019-06-01')
+        no_date = make_instance(instance_id='i-4', stop_after='TBD (Nagbot: Warned on 2019-06-02)')
+        stopped = make_instance(instance_id='i-5', state='stopped',
+                                terminate_after='2019-06-01 (Nagbot: Warned on 2019-06-02)')
+
+        assert scheduler.get_stop_deadline(warned_early) == '2019-06-03 17:00'
+        assert scheduler.get_stop_deadline(warned_late) == '2019-06-02'
+        assert scheduler.get_stop_deadline(not_warned) is None
+        assert scheduler.get_stop_deadline(no_date) == '2019-06-02'
+        assert scheduler.get_stop_deadline(stopped) is None
+        assert scheduler.get_terminate_deadline(stopped) == '2019-06-05'
+
+        index = scheduler.build_deadline_index([warned_early, warned_late, not_warned, no_date, stopped])
+        assert sorted(index) == [('2019-06-02', 'i-2', actions.STOP),
+                                 ('2019-06-02', 'i-4', actions.STOP),
+                                 ('2019-06-03 17:00', 'i-1', actions.STOP),
+                                 ('2019-06-05', 'i-5', actions.TERMINATE)]
+
+
+    @patch('app.scheduler.sqslack')
+    @patch('app.scheduler.sqaws')
+    @patch('app.scheduler.actions.run_actions')
+    def test_run_due(self, mock_run_actions, mock_sqaws, mock_sqslack):
+        soon = make_instance(instance_id='i-1', stop_after='2019-06-03 17:00 (Nagbot: Warned on 2019-06-01)')
+        later = make_instance(instance_id='i-2', stop_after='2019-06-03 18:00 (Nagbot: Warned on 2019-06-01)')
+        mock_sqaws.get_ec2_instance.side_effect = lambda region_name, instance_id: {'i-1': soon, 'i-2': later}[instance_id]
+        mock_run_actions.side_effect = lambda pairs, **kwargs: [actions.ActionResult(pairs[0][0], pairs[0][1],
+                                                                                     requested=True)]
+        now = datetime(2019, 6, 3, 16, 0)
+        s = scheduler.Scheduler('#nagbot', lambda: [soon, later], clock=lambda: now)
+        s.rescan()
+
+        # Nothing is due yet, so sleep until the first deadline
+        assert s.run_due() == 0
+        assert s.get_sleep_seconds() == 15 * 60  # Capped, rather than the full hour
+
+        now = datetime(2019, 6, 3, 17, 0)
+        assert s.run_due() == 1
+        mock_run_actions.assert_called_once()
+        assert mock_run_actions.call_args[0][0] == [(soon, actions.STOP)]
+        mock_sqaws.get_ec2_instance.assert_called_once_with('us-east-1', 'i-1')
+        mock_sqaws.set_tag.assert_called_once_with('us-east-1', 'i-1', 'Nagbot State', 'Stopped on 2019-06-03')
+        assert s.index == [('2019-06-03 18:00', 'i-2', actions.STOP)]
+
+
+    @patch('app.scheduler.sqaws')
+    @patch('app.scheduler.actions.run_actions')
+    def test_run_due_rechecks_instance(self, mock_run_actions, mock_sqaws):
+        instance = make_instance(instance_id='i-1', stop_after='2019-06-03 (Nagbot: Warned on 2019-06-01)')
+        # Someone pushed back the "Stop after" date since the last scan
+        mock_sqaws.get_ec2_instance.return_value = make_instance(instance_id='i-1', stop_after='2019-07-01')
+        s = scheduler.Scheduler('#nagbot', lambda: [instance], clock=lambda: datetime(2019, 6, 3, 9, 0))
+        s.rescan()
+
+        assert s.run_due() == 0
+        mock_run_actions.assert_not_called()
+        assert s.index == []
+
+
+    # The real sequence for an hour-precision tag: the daily 'notify' warns on the day, and the scheduler stops the
+    # instance at the tagged hour
+    @patch('app.scheduler.sqslack')
+    @patch('app.scheduler.sqaws')
+    @patch('app.scheduler.actions.run_actions')
+    @patch('app.sqslack.lookup_user_by_email')
+    @patch('app.sqaws.set_tag')
+    @patch('app.nagbot.TODAY_YYYY_MM_DD', '2019-06-03')
+    def test_notify_then_stop_at_hour(self, mock_set_tag, mock_lookup_user_by_email, mock_run_actions, mock_sqaws,
+                                      mock_sqslack):
+        instance = make_instance(instance_id='i-1', stop_after='2019-06-03 17:00')
+        stoppable = nagbot.get_stoppable_instances([instance], '2019-06-03')
+        assert stoppable == [instance]
+        nagbot.warn_stoppable_instances(stoppable)
+        mock_set_tag.assert_called_once_with('us-east-1', 'i-1', 'Stop after',
+                                             '2019-06-03 17:00 (Nagbot: Warned on 2019-06-03)')
+
+        warned = make_instance(instance_id='i-1', stop_after=mock_set_tag.call_args[0][3])
+        mock_sqaws.get_ec2_instance.return_value = warned
+        mock_run_actions.side_effect = lambda pairs, **kwargs: [actions.ActionResult(pairs[0][0], pairs[0][1],
+                                                                                     requested=True)]
+        now = datetime(2019, 6, 3, 9, 0)
+        s = scheduler.Scheduler('#nagbot', lambda: [warned], clock=lambda: now)
+        s.rescan()
+        assert s.run_due() == 0
+
+        now = datetime(2019, 6, 3, 17, 0)
+        assert s.run_due() == 1
+        assert mock_run_actions.call_args[0][0] == [(warned, actions.STOP)]
+
+
+    @patch('app.scheduler.sqslack')
+    def test_run_survives_errors(self, mock_sqslack):
+        class Stop(Exception):
+            pass
+
+        scans = [Exception('Rate exceeded'), Exception('Rate exceeded'), []]
+        def list_instances():
+            result = scans.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        sleeps = []
+        def sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 3:
+                raise Stop()
+
+        mock_sqslack.send_message.side_effect = Exception('Slack is down')
+        s = scheduler.Scheduler('#nagbot', list_instances, clock=lambda: datetime(2019, 6, 3, 9, 0), sleep=sleep)
+
+        with self.assertRaises(Stop):
+            s.run()
+
+        # Back off after each failure, and carry on once the scan works again
+        assert sleeps == [60, 120, 15 * 60]
+        assert mock_sqslack.send_message.call_count == 2
+        assert 'Rate exceeded' in mock_sqslack.send_message.call_args[0][1]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from app import shards
+from tests import make_instance
+
+
+class TestShards(unittest.TestCase):
+    def test_parse_shard(self):
+        assert shards.parse_shard('0/4') == (0, 4)
+        assert shards.parse_shard('3/4') == (3, 4)
+
+        for bad_shard in ['4/4', '0/0', '1', 'a/b', '-1/4']:
+            with self.assertRaises(ValueError):
+                shards.parse_shard(bad_shard)
+
+
+    def test_get_shard_regions(self):
+        regions = ['us-west-2', 'eu-west-1', 'us-east-1', 'ap-south-1', 'us-east-2']
+
+        shard_regions = [shards.get_shard_regions(regions, i, 3) for i in range(3)]
+
+        # Every region is in exactly one shard, no matter what order the regions were listed in
+        assert sorted(r for s in shard_regions for r in s) == sorted(regions)
+        assert shard_regions == [shards.get_shard_regions(list(reversed(regions)), i, 3) for i in range(3)]
+
+
+    @patch('app.shards.sqaws.list_ec2_instances')
+    @patch('app.shards.sqaws.list_region_names')
+    def test_scan_and_merge_shards(self, mock_list_region_names, mock_list_ec2_instances):
+        mock_list_region_names.return_value = ['us-east-1', 'us-west-2']
+        mock_list_ec2_instances.side_effect = lambda region_names: [make_instance(region_name=r, instance_id='i-' + r)
+                                                                    for r in region_names]
+
+        with tempfile.TemporaryDirectory() as shard_dir:
+            # Left over from yesterday's run
+            shards.scan_shard(shard_dir, 1, 2, run_id='2019-05-31')
+            shards.scan_shard(shard_dir, 0, 2, run_id='2019-06-01')
+
+            # Can't merge until every shard is done, and the old results don't count
+            with self.assertRaises(RuntimeError):
+                shards.merge_shards(shard_dir, run_id='2019-06-01')
+
+            shards.scan_shard(shard_dir, 1, 2, run_id='2019-06-01')
+            instances = shards.merge_shards(shard_dir, run_id='2019-06-01')
+
+            assert sorted(os.listdir(shard_dir)) == ['shard-2019-05-31-1-of-2.jsonl', 'shard-2019-06-01-0-of-2.jsonl',
+                                                     'shard-2019-06-01-1-of-2.jsonl']
+            assert [i.instance_id for i in instances] == ['i-us-east-1', 'i-us-west-2']
+
+
+if __name__ == '__main__':
+    unittest.main()
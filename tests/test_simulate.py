@@ -0,0 +1,81 @@
+import unittest
+
+from app import simulate
+from tests import make_instance
+
+
+class TestSimulate(unittest.TestCase):
+    def setup_instance(self, instance_id: str, state: str, **overrides):
+        return make_instance(instance_id=instance_id, state=state, monthly_price=150.0 if state == 'running' else 10.0,
+                             monthly_server_price=140.0, monthly_storage_price=10.0, **overrides)
+
+
+    def make_instances(self):
+        return [self.setup_instance('i-1', 'running', stop_after='2019-06-03'),
+                self.setup_instance('i-2', 'running', stop_after='2019-06-03 17:00', terminate_after='2019-06-05'),
+                self.setup_instance('i-3', 'running', stop_after='2019-06-01 (Nagbot: Warned on 2019-05-31)'),
+                self.setup_instance('i-4', 'running', stop_after='2020-01-01'),
+                self.setup_instance('i-5', 'running', stop_after='On Weekends'),
+                self.setup_instance('i-6', 'running', name='bam::bamboo'),
+                self.setup_instance('i-7', 'stopped', terminate_after='2019-06-02'),
+                self.setup_instance('i-8', 'stopped', terminate_after='2019-06-02 (Nagbot: Warned on 2019-05-30)'),
+                self.setup_instance('i-9', 'stopped'),
+                self.setup_instance('i-10', 'terminated', terminate_after='2019-06-02')]
+
+
+    # The simple but slow way: check every instance on every day
+    def simulate_every_day(self, instances, dates):
+        results = []
+        current = list(instances)
+        for today in dates:
+            day_results = []
+            for n, instance in enumerate(current):
+                for step in (simulate.simulate_execute, simulate.simulate_notify):
+                    action, instance = step(instance, today)
+                    if action is not None:
+                        day_results.append(action)
+                current[n] = instance
+            results += sorted(day_results, key=lambda a: simulate.ACTION_ORDER[a.action])
+        return results
+
+
+    def test_simulate(self):
+        instances = self.make_instances()
+        results = simulate.simulate(instances, '2019-06-01', days=10)
+        actions = [(r.date, r.action, r.instance.instance_id) for r in results]
+
+        assert actions == [('2019-06-01', 'stop', 'i-3'),
+                           ('2019-06-01', 'warn-stop', 'i-5'),
+                           ('2019-06-02', 'terminate', 'i-8'),
+                           ('2019-06-02', 'stop', 'i-5'),
+                           ('2019-06-02', 'warn-terminate', 'i-7'),
+                           ('2019-06-03', 'warn-terminate', 'i-7'),
+                           ('2019-06-03', 'warn-stop', 'i-1'),
+                           ('2019-06-03', 'warn-stop', 'i-2'),  # Warned on the day its "Stop after" time falls on
+                           ('2019-06-04', 'stop', 'i-1'),
+                           ('2019-06-04', 'stop', 'i-2'),
+                           ('2019-06-04', 'warn-terminate', 'i-7'),
+                           ('2019-06-05', 'terminate', 'i-7'),
+                           ('2019-06-05', 'warn-terminate', 'i-2'),
+                           ('2019-06-06', 'warn-terminate', 'i-2'),
+                           ('2019-06-07', 'warn-terminate', 'i-2'),
+                           ('2019-06-08', 'terminate', 'i-2')]
+        assert results[0].monthly_savings == 140.0
+        assert results[2].monthly_savings == 10.0
+        assert instances == self.make_instances()  # Unchanged
+
+        summary = simulate.make_summary(results, '2019-06-01', 10)
+        assert 'Stopped 4 instances, saving $560.00 per month' in summary
+        assert 'Terminated 3 instances, saving $30.00 per month' in summary
+
+
+    def test_simulate_matches_every_day(self):
+        instances = self.make_instances()
+        dates = ['2019-05-%02d' % d for d in range(20, 32)] + ['2019-06-%02d' % d for d in range(1, 31)]
+
+        assert simulate.simulate(instances, '2019-05-20', days=len(dates)) == \
+            self.simulate_every_day(instances, dates)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,6 +19,35 @@ class TestAws(unittest.TestCase):
                              'Terminate after': '2021-01-01',
                              'Name': 'super-cool-server.seeq.com'}
 
+    def test_get_tag_fields(self):
+        tags = {'Name': 'super-cool-server.seeq.com', 'StopAfter': '2020-01-01', 'Terminate After': '2021-01-01'}
+
+        assert app.sqaws.get_tag_fields(tags) == {'name': 'super-cool-server.seeq.com',
+                                                  'stop_after': '2020-01-01',
+                                                  'terminate_after': '2021-01-01',
+                                                  'contact': '',
+                                                  'nagbot_state': ''}
+
+
+    def test_region_from_queue_url(self):
+        queue_url = 'https://sqs.us-east-1.amazonaws.com/123456789012/nagbot-events'
+        assert app.sqaws.region_from_queue_url(queue_url) == 'us-east-1'
+
+
+    @patch('app.sqaws.boto3.client')
+    def test_delete_queue_messages(self, mock_client):
+        queue_url = 'https://sqs.us-east-1.amazonaws.com/123456789012/nagbot-events'
+        receipt_handles = ['handle-%d' % n for n in range(15)]
+        mock_sqs = mock_client.return_value
+        mock_sqs.delete_message_batch.side_effect = [
+            {'Successful': [{'Id': str(n)} for n in range(10)]},
+            {'Successful': [{'Id': '0'}, {'Id': '1'}, {'Id': '3'}, {'Id': '4'}],
+             'Failed': [{'Id': '2', 'SenderFault': True, 'Code': 'ReceiptHandleIsInvalid'}]}]
+
+        assert app.sqaws.delete_queue_messages(queue_url, receipt_handles) == ['handle-12']
+        assert mock_sqs.delete_message_batch.call_count == 2
+
+
     @patch('app.sqaws.boto3.client')
     def test_set_tag(self, mock_client):
         region_name = 'us-east-1'
@@ -36,6 +65,30 @@ class TestAws(unittest.TestCase):
         }])
 
 
+    @patch('app.sqaws.boto3.client')
+    def test_describe_instance_states(self, mock_client):
+        region_name = 'us-east-1'
+        instance_ids = ['i-%d' % n for n in range(250)]
+        mock_ec2 = mock_client.return_value
+        terminated_long_ago = {'i-7', 'i-210'}
+
+        # Like the real API, unknown IDs in a filter are just not found, and results may come in pages
+        def describe_instances(Filters, NextToken=None):
+            ids = [id for id in Filters[0]['Values'] if id not in terminated_long_ago]
+            page = ids[:100] if NextToken is None else ids[100:]
+            response = {'Reservations': [{'Instances': [{'InstanceId': id, 'State': {'Name': 'stopped'}}
+                                                        for id in page]}]}
+            if NextToken is None and len(ids) > 100:
+                response['NextToken'] = 'page-2'
+            return response
+        mock_ec2.describe_instances.side_effect = describe_instances
+
+        states = app.sqaws.describe_instance_states(region_name, instance_ids)
+
+        assert states == {id: 'stopped' for id in instance_ids if id not in terminated_long_ago}
+        assert mock_ec2.describe_instances.call_count == 3
+
+
     @patch('app.sqaws.boto3.client')
     def test_stop_instance(self, mock_client):
         region_name = 'us-east-1'
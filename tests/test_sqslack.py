@@ -1,6 +1,6 @@
 import os
 import unittest
-from unittest.mock import patch
+from unittest.mock import call, patch
 
 import app.sqslack
 
@@ -25,6 +25,29 @@ class TestSlack(unittest.TestCase):
         mock_slack.chat_postMessage.assert_called_once_with(channel=channel, text=message, as_user=True)
 
 
+    @patch('app.sqslack.slack.WebClient')
+    def test_send_lines(self, mock_client):
+        mock_slack, token = self.setup_mock_slack(mock_client)
+        mock_slack.chat_postMessage.return_value = {'ts': '1234.5678'}
+        channel = '#nagbot'
+        lines = ['x' * 2000, 'y' * 2000, 'z']
+
+        app.sqslack.send_lines(channel, lines)
+
+        assert mock_slack.chat_postMessage.call_args_list == [
+            call(channel=channel, text='x' * 2000, as_user=True),
+            call(channel=channel, text='y' * 2000 + '\nz', as_user=True, thread_ts='1234.5678')]
+
+
+    def test_split_lines(self):
+        assert app.sqslack.split_lines([], 10) == ['']
+        assert app.sqslack.split_lines(['abc', 'def'], 10) == ['abc\ndef']
+
+        # Lines are never split, unless a single line is too long by itself
+        assert app.sqslack.split_lines(['abc', 'def', 'ghijk', 'x'], 8) == ['abc\ndef', 'ghijk\nx']
+        assert app.sqslack.split_lines(['abc', 'd' * 25, 'e'], 10) == ['abc', 'd' * 10, 'd' * 10, 'ddddd\ne']
+
+
     @patch('app.sqslack.slack.WebClient')
     def test_lookup_user_by_email(self, mock_client):
         mock_slack, token = self.setup_mock_slack(mock_client)